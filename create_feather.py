@@ -1,8 +1,36 @@
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import pandas as pd
 import re
 from pathlib import Path
 from datetime import datetime
+from dataframes.shisetsu_kijun import BED_COUNT_COLUMN_PREFIX, FILING_COLUMNS, FILING_TYPE_COLUMNS, INSTITUTION_KEY_COLUMNS
+from dataframes.shisetsu_kijun import get_companion_file_path
+from dataframes.filing_history import FilingHistoryStore
+
+# Version of the Excel parsing step; bump it whenever read_excel_file output changes
+# so that cached ingest shards created by an older parser are not reused
+PARSER_VERSION = 1
+
+
+# Era to Western year base mapping
+ERA_BASE_YEARS = {
+    '令和': 2018,  # 令和元年 = 2019 = 2018 + 1
+    '平成': 1988,  # 平成元年 = 1989 = 1988 + 1
+    '昭和': 1925,  # 昭和元年 = 1926 = 1925 + 1
+    '大正': 1911,  # 大正元年 = 1912 = 1911 + 1
+    '明治': 1867,  # 明治元年 = 1868 = 1867 + 1
+}
+
+# Pattern to match: 元号(元年|N年)M月 D日
+# Examples: "令和元年12月 1日", "平成29年 9月 1日", "令和 6年 7月 1日", "令和6年7月1日"
+# Handle both half-width and full-width spaces (\s includes \u3000) after the era name
+# and between year/month/day
+ERA_DATE_PATTERN = re.compile(
+    rf'^(?P<era>{"|".join(ERA_BASE_YEARS)})[\s\u3000]*(?:元|(?P<year>\d+))年'
+    r'[\s\u3000]*(?P<month>\d+)[\s\u3000]*月[\s\u3000]*(?P<day>\d+)[\s\u3000]*日'
+)
 
 
 def parse_japanese_era_date(date_str):
@@ -22,156 +50,421 @@ def parse_japanese_era_date(date_str):
     if pd.isna(date_str) or not date_str:
         return None
     
-    date_str = str(date_str).strip()
-    if not date_str:
+    match = ERA_DATE_PATTERN.match(str(date_str).strip())
+    if not match:
         return None
     
-    # Era to Western year base mapping
-    era_base = {
-        '令和': 2018,  # 令和元年 = 2019 = 2018 + 1
-        '平成': 1988,  # 平成元年 = 1989 = 1988 + 1
-        '昭和': 1925,  # 昭和元年 = 1926 = 1925 + 1
-        '大正': 1911,  # 大正元年 = 1912 = 1911 + 1
-        '明治': 1867,  # 明治元年 = 1868 = 1867 + 1
-    }
-    
-    # Pattern to match: 元号(元年|N年)M月 D日
-    # Examples: "令和元年12月 1日", "平成29年 9月 1日", "令和 6年 7月 1日"
-    # Match one of the era names explicitly
-    # Handle spaces after era name and between year/month/day
-    # Handle both half-width and full-width spaces (\s includes \u3000)
-    era_pattern = '|'.join(era_base.keys())
-    # Allow spaces after era name: 令和 6年 or 令和6年
-    pattern = rf'({era_pattern})[\s\u3000]*(?:元|(\d+))年[\s\u3000]*(\d+)[\s\u3000]*月[\s\u3000]*(\d+)[\s\u3000]*日'
-    match = re.match(pattern, date_str)
+    # Calculate Western year (year group is None for 元年)
+    year_str = match.group('year')
+    western_year = ERA_BASE_YEARS[match.group('era')] + (int(year_str) if year_str is not None else 1)
     
-    if not match:
-        # Try alternative pattern without spaces (for cases like "令和6年7月1日")
-        pattern = rf'({era_pattern})(?:元|(\d+))年(\d+)月(\d+)日'
-        match = re.match(pattern, date_str)
+    month = int(match.group('month'))
+    day = int(match.group('day'))
+    if month < 1 or month > 12 or day < 1 or day > 31:
+        return None
     
-    if not match:
+    try:
+        return datetime(western_year, month, day)
+    except ValueError:
         return None
+
+
+def parse_japanese_era_dates(values):
+    """Parse a column of Japanese era date strings in bulk
     
-    era_name = match.group(1)
-    year_str = match.group(2)  # None if 元年
-    month_str = match.group(3)
-    day_str = match.group(4)
+    Only distinct values are parsed, with a single vectorized str.extract pass,
+    and the results are mapped back to every row.
     
-    # Get era base year (already validated by regex, but double-check)
-    if era_name not in era_base:
-        return None
+    Args:
+        values: Series of Japanese era date strings
+        
+    Returns:
+        DataFrame aligned with values with columns:
+        - era: Era name (e.g. "令和")
+        - year: Western year
+        - month: Month
+        - day: Day
+        - date: datetime64 date (NaT if parsing fails)
+    """
+    codes, uniques = pd.factorize(values)
+    unique_values = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    
+    parts = unique_values.str.extract(ERA_DATE_PATTERN)
+    # int() like parse_japanese_era_date: \d also matches full-width digits (e.g. "６"), which pd.to_numeric rejects
+    numbers = parts[['year', 'month', 'day']].apply(lambda col: pd.to_numeric(col.map(int, na_action='ignore')))
+    # Missing year means 元年
+    year = parts['era'].map(ERA_BASE_YEARS) + numbers['year'].fillna(1)
+    month = numbers['month']
+    day = numbers['day']
     
-    # Calculate Western year
-    if year_str is None:  # 元年
-        western_year = era_base[era_name] + 1
+    valid = parts['era'].notna() & month.between(1, 12) & day.between(1, 31)
+    components = pd.DataFrame({
+        'year': year.where(valid),
+        'month': month.where(valid),
+        'day': day.where(valid),
+    })
+    # Impossible dates such as 2月30日 become NaT
+    components['date'] = pd.to_datetime(components, errors='coerce')
+    components = components.astype({'year': 'Int64', 'month': 'Int64', 'day': 'Int64'})
+    components.insert(0, 'era', parts['era'].where(valid))
+    
+    # Map back to rows; missing values (code -1) are not in the index and become null
+    result = components.reindex(codes)
+    result.index = values.index
+    return result
+
+
+# Separator between multiple bed entries: "／" (全角スラッシュ) or "/" (半角スラッシュ)
+BED_COUNT_SEPARATOR_PATTERN = re.compile(r'[／/]')
+# Bed type and number separated by half-width or full-width spaces
+BED_COUNT_ENTRY_PATTERN = re.compile(r'^(.+?)[\s\u3000]+(\d+)$')
+
+
+def normalize_bed_type(bed_type):
+    """Normalize bed type name: convert full-width spaces and remove duplicated words
+    
+    Example: "一般　一般" -> "一般"
+    """
+    bed_type = bed_type.strip().replace('\u3000', ' ').strip()  # 全角スペースを半角に変換してトリム
+    words = bed_type.split()
+    return ' '.join(sorted(set(words), key=words.index))  # 順序を保ちつつ重複除去
+
+
+def parse_bed_count(value):
+    """Parse a single 病床数 value to dict format
+    
+    Formats supported:
+    - "一般　　22" -> {"一般": 22}
+    - "一般　　1178／精神　　40" -> {"一般": 1178, "精神": 40}
+    - "22" -> {None: 22}
+    - "一般" -> {} (entries without a number are dropped)
+    
+    Args:
+        value: Raw 病床数 cell value
+        
+    Returns:
+        Dict mapping bed type to bed count
+    """
+    if pd.isna(value):
+        return {}
+    
+    bed_dict = {}
+    for part in BED_COUNT_SEPARATOR_PATTERN.split(str(value).strip()):
+        part = part.strip()
+        if not part:
+            continue
+        
+        # Extract type and number from each part
+        match = BED_COUNT_ENTRY_PATTERN.match(part)
+        if match:
+            bed_dict[normalize_bed_type(match.group(1))] = int(match.group(2))
+        elif part.isdigit():
+            # Number only
+            bed_dict[None] = int(part)
+        else:
+            # Type only (no count): stored as None and removed below
+            bed_type = normalize_bed_type(part)
+            if bed_type:
+                bed_dict[bed_type] = None
+    
+    # Keep only keys that have actual values (not None)
+    # Exception: keep {None: number} format for number-only entries
+    return {k: v for k, v in bed_dict.items() if v is not None}
+
+
+def parse_bed_counts(values):
+    """Parse a 病床数 column to dict format, parsing each distinct value only once
+    
+    The same few thousand strings repeat over hundreds of thousands of filing rows,
+    so values are factorized first and the parsed dicts are mapped back by code.
+    
+    Args:
+        values: Series of raw 病床数 values
+        
+    Returns:
+        List of bed count dicts aligned with values
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = [parse_bed_count(value) for value in uniques]
+    # Code -1 marks missing values
+    return [parsed[code] if code >= 0 else {} for code in codes]
+
+
+def read_excel_file(excel_file):
+    """Read all sheets of an Excel file, opening the workbook only once
+    
+    Args:
+        excel_file: Path to the Excel file
+        
+    Returns:
+        List of DataFrames, one per sheet (in sheet order)
+    """
+    sheet_dataframes = []
+    with pd.ExcelFile(excel_file) as xl_file:
+        for sheet_name in xl_file.sheet_names:
+            # Parse from the already opened workbook with skiprows=3
+            df = xl_file.parse(sheet_name, skiprows=3)
+            assert '区分' in df.columns, f"区分 column is not found in {Path(excel_file).name} {sheet_name}"
+            sheet_dataframes.append(df)
+    return sheet_dataframes
+
+
+def get_cache_key(excel_file):
+    """Get cache key for an Excel file from its content hash and the parser version
+    
+    Args:
+        excel_file: Path to the Excel file
+        
+    Returns:
+        Hex digest string identifying the parsed content of the file
+    """
+    hasher = hashlib.sha256(f"parser-v{PARSER_VERSION}:".encode())
+    with open(excel_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def load_excel_files(excel_files, max_workers=None, cache_dir=None):
+    """Read all sheets of the given Excel files, in parallel across worker processes
+    
+    When cache_dir is given, each workbook is stored as a Feather shard keyed by
+    its content hash and the parser version, and unchanged workbooks are read
+    from their shard instead of being parsed again.
+    
+    Args:
+        excel_files: List of Excel file paths
+        max_workers: Number of worker processes (default: number of CPUs, 1 disables parallelism)
+        cache_dir: Optional directory for per-workbook ingest shards
+        
+    Returns:
+        List of DataFrames in the same order as a sequential read (file order, then sheet order)
+    """
+    shard_paths = {}
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        shard_paths = {excel_file: cache_dir / f"{get_cache_key(excel_file)}.feather" for excel_file in excel_files}
+    
+    # Only parse workbooks that have no shard yet
+    pending_files = [excel_file for excel_file in excel_files
+                     if excel_file not in shard_paths or not shard_paths[excel_file].exists()]
+    
+    if max_workers == 1 or len(pending_files) <= 1:
+        results = [read_excel_file(excel_file) for excel_file in pending_files]
     else:
-        western_year = era_base[era_name] + int(year_str)
+        # executor.map keeps the input order, so the concatenated frame is identical to a sequential read
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(read_excel_file, pending_files))
+    parsed = dict(zip(pending_files, results, strict=True))
     
-    # Parse month and day
-    try:
-        month = int(month_str)
-        day = int(day_str)
+    all_dataframes = []
+    for excel_file in excel_files:
+        if excel_file in parsed:
+            sheet_dataframes = parsed[excel_file]
+            if excel_file in shard_paths:
+                # Write to a temporary file first so that an interrupted run never leaves a broken shard
+                shard_path = shard_paths[excel_file]
+                tmp_path = shard_path.with_suffix('.tmp')
+                pd.concat(sheet_dataframes, ignore_index=True).to_feather(tmp_path)
+                tmp_path.replace(shard_path)
+            all_dataframes.extend(sheet_dataframes)
+        else:
+            all_dataframes.append(pd.read_feather(shard_paths[excel_file]))
+    
+    return all_dataframes
+
+
+def expand_bed_counts(bed_dicts):
+    """Expand 病床数 dicts to one nullable integer column per bed type
+    
+    Columns are named BED_COUNT_COLUMN_PREFIX + bed type (e.g. 病床数_一般) and ordered
+    by how many rows have the bed type, so common types such as 一般 come first.
+    Counts without a bed type ({None: 22}) go to the bare prefix column.
+    
+    Args:
+        bed_dicts: List of dicts mapping bed type to bed count
         
-        # Validate date
-        if month < 1 or month > 12 or day < 1 or day > 31:
-            return None
+    Returns:
+        DataFrame of Int32 columns aligned with bed_dicts
+    """
+    bed_counts = pd.DataFrame.from_records(bed_dicts, index=pd.RangeIndex(len(bed_dicts)))
+    bed_counts = bed_counts[bed_counts.notna().sum().sort_values(ascending=False, kind='stable').index]
+    bed_counts.columns = [f"{BED_COUNT_COLUMN_PREFIX}{'' if bed_type is None else bed_type}" for bed_type in bed_counts.columns]
+    return bed_counts.astype('Int32')
+
+
+def build_remarks_table(df):
+    """Build long-form remarks table from 備考（見出し） and 備考（データ） columns
+    
+    Rows with a blank header are skipped and blank data becomes an empty string.
+    If a filing has the same header more than once, the last value wins.
+    
+    Args:
+        df: Raw DataFrame before grouping by 医療機関番号 and 受理番号
         
-        # Create datetime object
-        return datetime(western_year, month, day)
-    except (ValueError, TypeError):
-        return None
+    Returns:
+        DataFrame with columns 医療機関番号, 受理番号, 備考（見出し）, 備考（データ）
+    """
+    key_columns = ['医療機関番号', '受理番号', '備考（見出し）']
+    if '備考（見出し）' not in df.columns or '備考（データ）' not in df.columns:
+        return pd.DataFrame(columns=key_columns + ['備考（データ）'])
+    
+    headers = df['備考（見出し）'].astype(str).str.strip()
+    mask = df['備考（見出し）'].notna() & (headers != '')
+    
+    data = df.loc[mask, '備考（データ）']
+    remarks = pd.DataFrame({
+        '医療機関番号': df.loc[mask, '医療機関番号'],
+        '受理番号': df.loc[mask, '受理番号'],
+        '備考（見出し）': headers[mask],
+        # Use data value, or empty string if data is blank
+        '備考（データ）': data.astype(str).str.strip().where(data.notna(), ''),
+    })
+    remarks = remarks.drop_duplicates(subset=key_columns, keep='last')
+    
+    return remarks.sort_values(['医療機関番号', '受理番号'], kind='stable').reset_index(drop=True)
+
+
+def nest_remarks(remarks):
+    """Convert long-form remarks table to one dict per filing
+    
+    Args:
+        remarks: Long-form remarks table from build_remarks_table
+        
+    Returns:
+        DataFrame with columns 医療機関番号, 受理番号, 備考集約 (dict mapping header to data)
+    """
+    nested = {}
+    for inst_num, juri_num, header, data in remarks.itertuples(index=False, name=None):
+        nested.setdefault((inst_num, juri_num), {})[header] = data
+    
+    return pd.DataFrame(
+        [(inst_num, juri_num, remarks_dict) for (inst_num, juri_num), remarks_dict in nested.items()],
+        columns=['医療機関番号', '受理番号', '備考集約'],
+    )
 
 
-def create_feather_file(input_dir_path, output_file_path):
-    """Load raw data from Excel files in data/2025/10 directory and parse bed count column"""
+def build_normalized_tables(df):
+    """Split the flat filings DataFrame into a normalized star schema
+    
+    医療機関番号 is only unique within a prefecture, so institutions are identified by
+    (都道府県コード, 医療機関番号). Each institution attribute is the first non-null value
+    over the institution's filings (like groupby first).
+    
+    Args:
+        df: Aggregated DataFrame (one row per 医療機関番号 and 受理番号) with typed bed count columns
+        
+    Returns:
+        Tuple of DataFrames:
+        - institutions: One row per institution, keyed by 医療機関ID
+        - filing_types: 受理届出名称 and 受理記号 dictionary, keyed by 届出ID
+        - filings: Fact table of 医療機関ID, 届出ID, 受理番号 and dates
+    """
+    # IDs are the row positions in the dimension tables
+    institution_ids = df.groupby(INSTITUTION_KEY_COLUMNS, dropna=False).ngroup().to_numpy()
+    filing_type_ids = df.groupby(FILING_TYPE_COLUMNS, dropna=False).ngroup().to_numpy()
+    
+    institution_columns = [col for col in df.columns if col not in FILING_COLUMNS and col not in INSTITUTION_KEY_COLUMNS]
+    # Groups come in the same sorted key order as ngroup, so row i is 医療機関ID i
+    institutions = (
+        df[INSTITUTION_KEY_COLUMNS + institution_columns]
+        .groupby(INSTITUTION_KEY_COLUMNS, dropna=False)
+        .first()
+        .reset_index()
+        .assign(医療機関ID=lambda institutions: institutions.index)
+    )
+    institutions = institutions[['医療機関ID'] + INSTITUTION_KEY_COLUMNS + institution_columns]
+    
+    filing_types = (
+        df[FILING_TYPE_COLUMNS]
+        .assign(届出ID=filing_type_ids)
+        .drop_duplicates(subset='届出ID', keep='first')
+        .sort_values('届出ID')
+        .reset_index(drop=True)
+    )
+    filing_types = filing_types[['届出ID'] + FILING_TYPE_COLUMNS]
+    
+    filings = pd.DataFrame({
+        '医療機関ID': institution_ids.astype('int32'),
+        '届出ID': filing_type_ids.astype('int32'),
+    })
+    for col in FILING_COLUMNS:
+        if col in df.columns and col not in FILING_TYPE_COLUMNS:
+            # Repeated strings such as 受理番号 are stored dictionary-encoded
+            filings[col] = df[col].astype('category') if df[col].dtype == object else df[col].to_numpy()
+    
+    return institutions, filing_types, filings
+
+
+def build_institution_summary(institutions, filing_types, filings):
+    """Build the institution summary table listed by the institution search page
+    
+    One row per institution of the normalized institutions table with its number of
+    filings (届出数, filings with a 受理届出名称), sorted by 医療機関名称.
+    
+    Args:
+        institutions: Institutions table from build_normalized_tables
+        filing_types: Filing type dictionary from build_normalized_tables
+        filings: Filings fact table from build_normalized_tables
+        
+    Returns:
+        DataFrame with the institution columns (without 医療機関ID) and 届出数
+    """
+    has_filing_name = filing_types['受理届出名称'].notna().to_numpy()[filings['届出ID'].to_numpy()]
+    filing_counts = (
+        pd.Series(has_filing_name, index=filings['医療機関ID'].to_numpy())
+        .groupby(level=0).sum()
+        .reindex(institutions['医療機関ID'], fill_value=0)
+    )
+    
+    summary = institutions.drop(columns='医療機関ID').assign(届出数=filing_counts.to_numpy().astype('int32'))
+    return summary.sort_values('医療機関名称', kind='stable').reset_index(drop=True)
+
+
+def get_default_history_month(input_dir_path):
+    """Get month key from an input directory path (e.g. data/2025/10 -> "2025/10")"""
+    path = Path(input_dir_path)
+    return f"{path.parent.name}/{path.name}"
+
+
+def create_feather_file(input_dir_path, output_file_path, max_workers=None, cache_dir=None, history_dir=None, history_month=None):
+    """Load raw data from Excel files in data/2025/10 directory and parse bed count column
+    
+    If history_dir is given, the filings are also appended to the FilingHistoryStore there
+    as the changes since the previous month (history_month defaults to the last two parts
+    of input_dir_path, e.g. "2025/10"). Rebuilding the latest month of the store replaces it.
+    
+    Raises:
+        ValueError: If history_month cannot be appended to the store (checked before any file is written)
+    """
+    # Validate the history month before parsing the rosters and writing the dataset files
+    if history_dir is not None:
+        history_store = FilingHistoryStore(history_dir)
+        history_month = history_month or get_default_history_month(input_dir_path)
+        history_store.check_month(history_month)
+    
     data_dir = Path(input_dir_path)
     
     # Collect all Excel files recursively
     excel_files = list(data_dir.glob("**/*.xlsx"))
-        
-    all_dataframes = []
     
-    # Load each Excel file and all its sheets
-    for excel_file in excel_files:
-        xl_file = pd.ExcelFile(excel_file)
-        
-        # Read all sheets from the Excel file
-        for sheet_name in xl_file.sheet_names:
-            # Read with skiprows=3
-            df = pd.read_excel(excel_file, sheet_name=sheet_name, skiprows=3)
-            assert '区分' in df.columns, f"区分 column is not found in {excel_file.name} {sheet_name}"
-            all_dataframes.append(df)
+    # Load each Excel file and all its sheets (workbooks are parsed in parallel)
+    all_dataframes = load_excel_files(excel_files, max_workers=max_workers, cache_dir=cache_dir)
     
     df = pd.concat(all_dataframes, ignore_index=True)
     
     # Parse 病床数 column first (before grouping)
     # This needs to be done before grouping to ensure all rows have processed 病床数
     
-    # Parse 病床数 column and convert to dict format
-    # Formats supported:
-    # - "一般　　22" -> {"一般": 22}
-    # - "一般　　1178／精神　　40" -> {"一般": 1178, "精神": 40}
-    # - "22" -> {None: 22}
-    # - "一般" -> {"一般": None}
+    # Parse 病床数 column and convert to dict format (see parse_bed_count for supported formats)
     if '病床数' in df.columns:
-        bed_dicts = []
-        
-        for value in df['病床数']:
-            if pd.isna(value):
-                bed_dicts.append({})
-                continue
-            
-            value_str = str(value).strip()
-            bed_dict = {}
-            
-            # Split by "／" (全角スラッシュ) or "/" (半角スラッシュ) if multiple entries
-            parts = re.split(r'[／/]', value_str)
-            
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-                
-                # Extract type and number from each part
-                # Pattern: 文字列部分と数値部分を分離
-                # 全角・半角スペースに対応
-                match = re.match(r'^(.+?)[\s\u3000]+(\d+)$', part)
-                if match:
-                    # Both type and number
-                    bed_type = match.group(1).strip().replace('\u3000', ' ').strip()  # 全角スペースを半角に変換してトリム
-                    # 重複した単語を除去（例: "一般 一般" -> "一般"）
-                    words = bed_type.split()
-                    bed_type = ' '.join(sorted(set(words), key=words.index))  # 順序を保ちつつ重複除去
-                    bed_number = int(match.group(2))
-                    bed_dict[bed_type] = bed_number
-                else:
-                    # Check if it's number only
-                    if part.isdigit():
-                        bed_dict[None] = int(part)
-                    else:
-                        # Type only - 全角スペースを処理して重複除去
-                        bed_type = part.strip().replace('\u3000', ' ').strip()
-                        words = bed_type.split()
-                        bed_type = ' '.join(sorted(set(words), key=words.index))  # 順序を保ちつつ重複除去
-                        if bed_type:  # 空文字列でない場合のみ
-                            bed_dict[bed_type] = None
-            
-            # Remove keys with None values to keep dict clean
-            # Keep only keys that have actual values (not None)
-            # Exception: keep {None: number} format for number-only entries
-            clean_bed_dict = {}
-            for k, v in bed_dict.items():
-                if v is not None:  # Keep all entries with non-None values
-                    clean_bed_dict[k] = v
-            bed_dicts.append(clean_bed_dict)
-        
         # Overwrite 病床数 column with dict format
-        df['病床数'] = bed_dicts
+        df['病床数'] = parse_bed_counts(df['病床数'])
     
     # Parse 算定開始年月日 column and create date column
     if '算定開始年月日' in df.columns:
-        df['算定開始年月日_date'] = df['算定開始年月日'].apply(parse_japanese_era_date)
+        df['算定開始年月日_date'] = parse_japanese_era_dates(df['算定開始年月日'])['date']
         
         # Assert that all non-null 算定開始年月日 values are successfully parsed
         problematic = df[df['算定開始年月日'].notna() & df['算定開始年月日_date'].isna()]
@@ -182,20 +475,6 @@ def create_feather_file(input_dir_path, output_file_path):
             raise AssertionError(error_msg)
     
     # Aggregate data by 医療機関番号 and 受理番号 to make them primary keys
-    # Create a function to aggregate remarks into a dict
-    def aggregate_remarks(group):
-        remarks_dict = {}
-        if '備考（見出し）' in group.columns and '備考（データ）' in group.columns:
-            for _, row in group.iterrows():
-                header = row['備考（見出し）']
-                data = row['備考（データ）']
-                # Skip if header is blank/NaN
-                if pd.notna(header) and str(header).strip():
-                    # Use data value, or empty string if data is blank
-                    data_value = str(data).strip() if pd.notna(data) and str(data).strip() else ''
-                    remarks_dict[str(header).strip()] = data_value
-        return remarks_dict
-    
     # Define aggregation functions for each column type
     def take_first_dict(x):
         """Take the first non-empty dict, or return empty dict if all are empty"""
@@ -217,25 +496,40 @@ def create_feather_file(input_dir_path, output_file_path):
             # For other columns, take the first non-null value
             agg_dict[col] = 'first'
     
-    # Group by 医療機関番号 and 受理番号
-    grouped = df.groupby(['医療機関番号', '受理番号'], dropna=False)
-    
-    # Aggregate remarks
-    aggregated_remarks = grouped.apply(aggregate_remarks).reset_index(name='備考集約')
+    # Aggregate remarks into a long-form table (one row per filing and header)
+    remarks = build_remarks_table(df)
     
-    # Aggregate other columns
-    df_agg = grouped.agg(agg_dict).reset_index()
+    # Group by 医療機関番号 and 受理番号 and aggregate other columns
+    df_agg = df.groupby(['医療機関番号', '受理番号'], dropna=False).agg(agg_dict).reset_index()
     
-    # Merge aggregated remarks
-    df = df_agg.merge(aggregated_remarks[['医療機関番号', '受理番号', '備考集約']], 
-                        on=['医療機関番号', '受理番号'], how='left')
+    # Merge aggregated remarks as a dict per filing
+    df = df_agg.merge(nest_remarks(remarks), on=['医療機関番号', '受理番号'], how='left')
     
     # Fill NaN with empty dict for 備考集約
-    df['備考集約'] = df['備考集約'].apply(lambda x: x if isinstance(x, dict) else {})
+    df['備考集約'] = [x if isinstance(x, dict) else {} for x in df['備考集約']]
     
     # assert len(df["都道府県名"].unique()) == 47, f"Some prefectures are missing.. {df["都道府県名"].unique()}"
 
-    df.drop('備考集約', axis=1).to_feather(output_file_path)
+    # Write 病床数 as typed columns (one nullable int column per bed type) instead of dicts
+    bed_count_position = df.columns.get_loc('病床数') if '病床数' in df.columns else len(df.columns)
+    output_df = df.drop(columns=['病床数', '備考集約'], errors='ignore')
+    if '病床数' in df.columns:
+        bed_counts = expand_bed_counts(df['病床数'].tolist())
+        output_df = pd.concat([output_df.iloc[:, :bed_count_position], bed_counts, output_df.iloc[:, bed_count_position:]], axis=1)
+    output_df.to_feather(output_file_path)
+    remarks.to_feather(get_companion_file_path(output_file_path, 'remarks'))
+    
+    # Write normalized dataset: institutions, filing type dictionary and slim filings fact table
+    normalized_tables = build_normalized_tables(output_df)
+    for name, table in zip(['institutions', 'filing_types', 'filings'], normalized_tables, strict=True):
+        table.to_feather(get_companion_file_path(output_file_path, name))
+    
+    # Write institution summary so the institution search page doesn't aggregate the filings at startup
+    build_institution_summary(*normalized_tables).to_feather(get_companion_file_path(output_file_path, 'institution_summary'))
+    
+    # Append the month's filings to the longitudinal store as a delta against the previous month
+    if history_dir is not None:
+        history_store.append_month(history_month, output_df)
 
     return df
 
@@ -244,5 +538,12 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--input-dir-path", type=str, help="input directory path that xlsx files are located. e.g. data/2025/10")
     parser.add_argument("--output-file-path", type=str, help="output feather file path. e.g. data/2025/10/all.feather")
+    parser.add_argument("--max-workers", type=int, default=None, help="number of worker processes for reading Excel files (default: number of CPUs)")
+    parser.add_argument("--cache-dir", type=str, default=None, help="directory for per-workbook ingest cache shards. e.g. data/.ingest_cache")
+    parser.add_argument("--history-dir", type=str, default=None, help="directory of the filing history store to append this month to. e.g. data/history")
+    parser.add_argument("--history-month", type=str, default=None, help="month key of the history store (default: last two parts of --input-dir-path). e.g. 2025/10")
     args = parser.parse_args()
-    df = create_feather_file(args.input_dir_path, args.output_file_path)
\ No newline at end of file
+    df = create_feather_file(
+        args.input_dir_path, args.output_file_path, max_workers=args.max_workers, cache_dir=args.cache_dir,
+        history_dir=args.history_dir, history_month=args.history_month,
+    )
\ No newline at end of file
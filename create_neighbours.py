@@ -0,0 +1,156 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dataframes import FilingIncidenceMatrix
+from dataframes.dataset_registry import get_dataset_fingerprint, load_dataset
+from dataframes.shisetsu_kijun import get_companion_file_path
+
+# Incidence matrix (CSR rows and postings only) of the current worker process
+_worker_incidence = None
+
+
+def init_worker(prefecture_codes, institution_numbers, filing_names, indptr, indices):
+    """Rebuild the incidence matrix once per worker process
+    
+    Only the CSR arrays are shipped to the workers; the postings (inverted index)
+    are built from them, so a worker holds O(number of filings) memory.
+    
+    Args:
+        prefecture_codes: 都道府県コード of the incidence rows
+        institution_numbers: 医療機関番号 of the incidence rows
+        filing_names: 受理届出名称 of the incidence columns
+        indptr: CSR row pointer array of the incidence matrix
+        indices: CSR column (filing type id) array of the incidence matrix
+    """
+    global _worker_incidence
+    _worker_incidence = FilingIncidenceMatrix(prefecture_codes, institution_numbers, filing_names, indptr, indices)
+    _worker_incidence.get_postings(0)
+
+
+def compute_neighbour_chunk(start, end, top_n):
+    """Compute the top-N Jaccard neighbours of a chunk of institutions
+    
+    Intersection sizes of each institution of the chunk with every institution are
+    counted from the posting lists of its filing types (FilingIncidenceMatrix.count_overlaps),
+    so only the chunk × institutions result is dense.
+    
+    Args:
+        start: First row of the chunk
+        end: Row after the last row of the chunk
+        top_n: Number of neighbours to keep per institution
+    
+    Returns:
+        Tuple of (source rows, neighbour rows, similarities, intersections, ranks)
+    """
+    incidence = _worker_incidence
+    intersections = np.empty((end - start, incidence.n_institutions), dtype=np.int32)
+    for row in range(start, end):
+        intersections[row - start] = incidence.count_overlaps(incidence.get_row_filing_ids(row))
+    
+    # |A ∪ B| = |A| + |B| - |A ∩ B| (at least 1, so two empty rows give 0 instead of NaN)
+    sizes = incidence.row_sizes.astype(np.int32)
+    unions = np.maximum(sizes[start:end, None] + sizes[None, :] - intersections, 1).astype(np.float32)
+    similarities = intersections.astype(np.float32)
+    np.divide(similarities, unions, out=similarities)
+    del unions
+    
+    # An institution is not its own neighbour
+    chunk_rows = np.arange(start, end)
+    similarities[chunk_rows - start, chunk_rows] = 0
+    
+    # Partial selection of the top-N candidates per row, then sort only those
+    n = min(top_n, similarities.shape[1])
+    candidates = np.argpartition(-similarities, n - 1, axis=1)[:, :n]
+    candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    neighbours = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(candidate_scores, order, axis=1)
+    
+    # Drop institutions sharing no filing
+    keep = scores > 0
+    source_rows = np.repeat(chunk_rows, keep.sum(axis=1))
+    ranks = np.broadcast_to(np.arange(1, n + 1), keep.shape)[keep]
+    neighbour_intersections = intersections[np.nonzero(keep)[0], neighbours[keep]]
+    return source_rows, neighbours[keep], scores[keep], neighbour_intersections.astype(np.int32), ranks
+
+
+def compute_neighbours(incidence, top_n=100, max_workers=None, chunk_size=256):
+    """Compute the top-N Jaccard neighbours of every institution
+    
+    Args:
+        incidence: FilingIncidenceMatrix
+        top_n: Number of neighbours to keep per institution
+        max_workers: Number of worker processes (default: number of CPUs, 1 disables parallelism)
+        chunk_size: Number of institutions per chunk
+    
+    Returns:
+        DataFrame with one row per (institution, neighbour) pair, sorted by 都道府県コード, 医療機関番号 and 順位
+        (attrs['top_n'] records top_n)
+    """
+    initargs = (incidence.prefecture_codes, incidence.institution_numbers, incidence.filing_names, incidence.indptr, incidence.indices)
+    chunks = [(start, min(start + chunk_size, incidence.n_institutions), top_n)
+              for start in range(0, incidence.n_institutions, chunk_size)]
+    
+    if max_workers == 1:
+        init_worker(*initargs)
+        results = [compute_neighbour_chunk(*chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=initargs) as executor:
+            results = list(executor.map(compute_neighbour_chunk, *zip(*chunks, strict=True)))
+    
+    source_rows, neighbour_rows, similarities, intersections, ranks = (
+        np.concatenate(parts) for parts in zip(*results, strict=True)
+    )
+    neighbours = pd.DataFrame({
+        '都道府県コード': incidence.prefecture_codes[source_rows],
+        '医療機関番号': incidence.institution_numbers[source_rows],
+        '順位': ranks.astype(np.int16),
+        '類似都道府県コード': incidence.prefecture_codes[neighbour_rows],
+        '類似医療機関番号': incidence.institution_numbers[neighbour_rows],
+        '類似度': similarities,
+        '重複届出数': intersections,
+    })
+    # Institutions with top_n neighbours may have more; the app lists them only when all are requested
+    neighbours.attrs['top_n'] = top_n
+    return neighbours
+
+
+def create_neighbours_file(input_file_path, output_file_path=None, top_n=100, max_workers=None, chunk_size=256):
+    """Compute the nearest-neighbour table and write it next to the dataset
+    
+    Args:
+        input_file_path: Dataset feather file path (e.g. data/2025/10/all.feather)
+        output_file_path: Output feather file path (default: <input>_neighbours.feather)
+        top_n: Number of neighbours to keep per institution
+        max_workers: Number of worker processes
+        chunk_size: Number of institutions per chunk
+    
+    Returns:
+        Neighbour table DataFrame (attrs['source_fingerprint'] identifies the dataset it was computed from)
+    """
+    if output_file_path is None:
+        output_file_path = get_companion_file_path(input_file_path, 'neighbours')
+    
+    # Fingerprint of the dataset before loading it, so a concurrent rewrite makes the table stale
+    source_fingerprint = get_dataset_fingerprint(input_file_path)
+    incidence = FilingIncidenceMatrix.from_shisetsu_kijun(load_dataset(input_file_path))
+    neighbours = compute_neighbours(incidence, top_n=top_n, max_workers=max_workers, chunk_size=chunk_size)
+    neighbours.attrs['source_fingerprint'] = source_fingerprint
+    
+    neighbours.to_feather(output_file_path)
+    return neighbours
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--input-file-path", type=str, help="input feather file path. e.g. data/2025/10/all.feather")
+    parser.add_argument("--output-file-path", type=str, default=None, help="output feather file path (default: <input>_neighbours.feather)")
+    parser.add_argument("--top-n", type=int, default=100, help="number of neighbours to keep per institution")
+    parser.add_argument("--max-workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="number of institutions per chunk")
+    args = parser.parse_args()
+    create_neighbours_file(args.input_file_path, args.output_file_path, top_n=args.top_n,
+                           max_workers=args.max_workers, chunk_size=args.chunk_size)
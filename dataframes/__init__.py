@@ -2,6 +2,13 @@ from .shisetsu_kijun import ShisetsuKijunDataFrame
 from .jaccard_similarity import JaccardSimilarityDataFrame
 from .cross_tabulation import ShisetsuKijunFilingCrossTabDataFrame
 from .filing_status import ShisetsuKijunFilingStatusDataFrame
+from .filing_incidence import FilingIncidenceMatrix, FilingRowIndex
+from .name_search import InstitutionNameIndex
+from .completion import CompletionIndex
+from .dataset_registry import DatasetRegistry
+from .filing_history import FilingHistoryStore
 
-__all__ = ['ShisetsuKijunDataFrame', 'JaccardSimilarityDataFrame', 'ShisetsuKijunFilingCrossTabDataFrame', 'ShisetsuKijunFilingStatusDataFrame']
+__all__ = ['ShisetsuKijunDataFrame', 'JaccardSimilarityDataFrame', 'ShisetsuKijunFilingCrossTabDataFrame', 'ShisetsuKijunFilingStatusDataFrame',
+           'FilingIncidenceMatrix', 'FilingRowIndex', 'InstitutionNameIndex', 'CompletionIndex',
+           'DatasetRegistry', 'FilingHistoryStore']
 
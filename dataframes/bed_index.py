@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+# Prefix of the typed bed count columns written by create_feather.py (e.g. 病床数_一般)
+# A bare prefix column holds counts without a bed type
+BED_COUNT_COLUMN_PREFIX = '病床数_'
+
+# Bed type membership is packed into uint64 words per row, 64 bed type names per word
+BED_TYPE_WORD_BITS = 64
+
+
+class BedCountIndex:
+    """Bed types and bed counts of the rows of a frame as numeric arrays
+    
+    Built once per frame so that the bed type and bed count filters become boolean
+    mask operations instead of re-scanning the 病床数 dicts. Columns are the 病床数
+    dict keys (None for counts without a bed type): present[i, j] tells whether row i
+    has bed type j and counts[i, j] is its count (NaN if absent or not a number).
+    type_bits packs the bed types of each row, by stripped name as shown in the
+    filters, into a bitmask of as many uint64 words as the names need (names are word
+    combinations such as "一般 療養", so a month may have more than 64).
+    """
+    
+    def __init__(self, bed_types, present, counts):
+        """Create index from presence and count matrices
+        
+        Args:
+            bed_types: List of bed types (病床数 dict keys), one per column
+            present: Boolean array of shape (n_rows, len(bed_types))
+            counts: Float array of shape (n_rows, len(bed_types)), NaN where there is no valid count
+        """
+        self.bed_types = list(bed_types)
+        self.present = present
+        self.counts = counts
+        
+        # Bed type names as shown in the filters (stripped, without the untyped column)
+        names = ['' if bed_type is None else str(bed_type).strip() for bed_type in self.bed_types]
+        self.type_names = sorted({name for name in names if name})
+        self._name_positions = {name: i for i, name in enumerate(self.type_names)}
+        n_words = max(1, -(-len(self.type_names) // BED_TYPE_WORD_BITS))
+        name_present = np.zeros((len(present), n_words * BED_TYPE_WORD_BITS), dtype=bool)
+        for j, name in enumerate(names):
+            if name:
+                name_present[:, self._name_positions[name]] |= present[:, j]
+        self.type_bits = self._pack_bits(name_present)
+        self._columns = {bed_type: j for j, bed_type in enumerate(self.bed_types)}
+    
+    @classmethod
+    def from_frame(cls, df):
+        """Build index from the typed bed count columns of a frame, or from its 病床数 dicts
+        
+        Args:
+            df: DataFrame with BED_COUNT_COLUMN_PREFIX columns or a 病床数 column
+        
+        Returns:
+            BedCountIndex aligned with the rows of df
+        """
+        bed_count_columns = [col for col in df.columns if str(col).startswith(BED_COUNT_COLUMN_PREFIX)]
+        if bed_count_columns:
+            bed_types = [col[len(BED_COUNT_COLUMN_PREFIX):] or None for col in bed_count_columns]
+            counts = df[bed_count_columns].to_numpy(dtype=np.float64, na_value=np.nan)
+            return cls(bed_types, ~np.isnan(counts), counts)
+        if '病床数' in df.columns:
+            return cls.from_bed_count_dicts(df['病床数'])
+        return cls([], np.zeros((len(df), 0), dtype=bool), np.zeros((len(df), 0)))
+    
+    @classmethod
+    def from_bed_count_dicts(cls, bed_counts):
+        """Build index from 病床数 dicts
+        
+        Rows often share the same dict object, so each distinct object is read once.
+        
+        Args:
+            bed_counts: Iterable of 病床数 dicts (other values have no bed types)
+        
+        Returns:
+            BedCountIndex aligned with bed_counts
+        """
+        bed_counts = list(bed_counts)
+        codes, _ = pd.factorize(np.array([id(bed_count) for bed_count in bed_counts], dtype=np.int64))
+        first_positions = np.full(codes.max() + 1 if len(codes) else 0, -1, dtype=np.int64)
+        first_positions[codes[::-1]] = np.arange(len(codes))[::-1]
+        distinct = [bed_counts[position] if isinstance(bed_counts[position], dict) else {} for position in first_positions]
+        
+        # Bed types in order of first appearance; non-numeric counts stay NaN but present
+        bed_types = list(dict.fromkeys(bed_type for bed_count in distinct for bed_type in bed_count))
+        columns = {bed_type: j for j, bed_type in enumerate(bed_types)}
+        present = np.zeros((len(distinct), len(bed_types)), dtype=bool)
+        counts = np.full((len(distinct), len(bed_types)), np.nan)
+        for i, bed_count in enumerate(distinct):
+            for bed_type, bed_num in bed_count.items():
+                present[i, columns[bed_type]] = True
+                if isinstance(bed_num, (int, float)) and bed_num is not None:
+                    counts[i, columns[bed_type]] = bed_num
+        return cls(bed_types, present[codes], counts[codes])
+    
+    @staticmethod
+    def _pack_bits(bits):
+        """Pack boolean rows of a multiple of BED_TYPE_WORD_BITS into uint64 words"""
+        return np.packbits(bits, axis=-1, bitorder='little').view(np.uint64)
+    
+    def _get_name_bits(self, bed_type_names):
+        """Get the bitmask words of bed type names (unknown names are ignored)"""
+        bits = np.zeros(self.type_bits.shape[1] * BED_TYPE_WORD_BITS, dtype=bool)
+        for name in bed_type_names:
+            position = self._name_positions.get(name)
+            if position is not None:
+                bits[position] = True
+        return self._pack_bits(bits)
+    
+    def __len__(self):
+        return len(self.present)
+    
+    def _resolve_rows(self, rows):
+        """Get row positions as an index array (all rows if None)"""
+        return slice(None) if rows is None else np.asarray(rows, dtype=np.int64)
+    
+    def has_invalid_counts(self):
+        """Check whether any bed type is present without a numeric count"""
+        return bool((self.present & np.isnan(self.counts)).any())
+    
+    def get_all_bed_types(self, rows=None):
+        """Get sorted names of the bed types that appear in any row
+        
+        Args:
+            rows: Optional row positions (all rows if None)
+        
+        Returns:
+            List of bed type names
+        """
+        all_bits = np.bitwise_or.reduce(self.type_bits[self._resolve_rows(rows)], axis=0, initial=np.uint64(0))
+        name_present = np.unpackbits(all_bits.view(np.uint8), bitorder='little')
+        return [name for name, present in zip(self.type_names, name_present, strict=False) if present]
+    
+    def has_any_bed_type(self, selected_bed_types, rows=None):
+        """Check which rows have at least one of the selected bed types
+        
+        Args:
+            selected_bed_types: List of bed type names
+            rows: Optional row positions to check (all rows if None)
+        
+        Returns:
+            Boolean array, one element per checked row
+        """
+        selected_bits = self._get_name_bits(selected_bed_types)
+        return (self.type_bits[self._resolve_rows(rows)] & selected_bits).any(axis=1)
+    
+    def get_bed_count_max(self, selected_bed_types, rows=None):
+        """Get maximum bed count for each selected bed type
+        
+        Args:
+            selected_bed_types: List of bed types (matched against the 病床数 dict keys)
+            rows: Optional row positions (all rows if None)
+        
+        Returns:
+            Dict mapping bed type to max bed count (bed types without any count are left out)
+        """
+        rows = self._resolve_rows(rows)
+        bed_count_max = {}
+        for bed_type in selected_bed_types:
+            j = self._columns.get(bed_type)
+            if j is None:
+                continue
+            counts = self.counts[rows, j]
+            counts = counts[~np.isnan(counts)]
+            if len(counts) > 0:
+                bed_count_max[bed_type] = int(counts.max())
+        return bed_count_max
+    
+    def in_bed_count_ranges(self, bed_count_filters, rows=None):
+        """Check which rows satisfy all bed count ranges
+        
+        A row passes a range if it lacks the bed type, and fails it if the bed type
+        is present without a numeric count or with a count outside [min_val, max_val].
+        
+        Args:
+            bed_count_filters: Dict mapping bed type (病床数 dict key) to (min_val, max_val) tuple
+            rows: Optional row positions to check (all rows if None)
+        
+        Returns:
+            Boolean array, one element per checked row
+        """
+        mask = np.ones(len(self) if rows is None else len(rows), dtype=bool)
+        rows = self._resolve_rows(rows)
+        for bed_type, (min_val, max_val) in bed_count_filters.items():
+            j = self._columns.get(bed_type)
+            if j is None:
+                continue
+            counts = self.counts[rows, j]
+            # NaN compares False, so present invalid counts fail the range
+            mask &= ~self.present[rows, j] | ((counts >= min_val) & (counts <= max_val))
+        return mask
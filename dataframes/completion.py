@@ -0,0 +1,214 @@
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+from .name_search import normalize_name
+
+# Character sorting after every normalized key character; closes the prefix range in the sorted keys
+PREFIX_RANGE_END = '\U0010ffff'
+
+# Number of entries sharing the most bigrams with the query that get an edit distance check
+FUZZY_CANDIDATES = 32
+
+# Query characters per allowed edit of the default fuzzy fallback; shorter queries get prefix
+# matches only, since one edit anywhere in a key matches almost any 2-3 character query
+FUZZY_CHARS_PER_EDIT = 4
+
+
+def substring_edit_distance(query, text):
+    """Smallest edit distance between query and any substring of text
+    
+    Levenshtein distance with free leading and trailing characters in text, so a
+    typo anywhere in the name still matches. Uses Myers' bit-parallel algorithm:
+    one column of the edit distance table is a pair of bitvectors over the query
+    characters, so each text character costs a few integer operations.
+    
+    Args:
+        query: Normalized query string (not empty)
+        text: Normalized text string
+    
+    Returns:
+        Edit distance
+    """
+    m = len(query)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    char_masks = {}
+    for i, char in enumerate(query):
+        char_masks[char] = char_masks.get(char, 0) | (1 << i)
+    
+    # Vertical deltas of the current column (+1 everywhere at the start) and its last cell
+    positive = mask
+    negative = 0
+    score = m
+    best = m
+    for char in text:
+        eq = char_masks.get(char, 0)
+        xv = eq | negative
+        xh = (((eq & positive) + positive) ^ positive) | eq
+        horizontal_positive = negative | (~(xh | positive) & mask)
+        horizontal_negative = positive & xh
+        if horizontal_positive & high:
+            score += 1
+        elif horizontal_negative & high:
+            score -= 1
+        # The top row is all zeros (a match may start anywhere), so nothing is shifted in
+        horizontal_positive = (horizontal_positive << 1) & mask
+        horizontal_negative = (horizontal_negative << 1) & mask
+        positive = horizontal_negative | (~(xv | horizontal_positive) & mask)
+        negative = horizontal_positive & xv
+        if score < best:
+            best = score
+    return best
+
+
+class CompletionIndex:
+    """Top-N completion over a list of entries (institution names, filing types, ...)
+    
+    Each entry has one or more keys (e.g. 受理届出名称 and 受理記号), normalized like the
+    name search (NFKC, lowercase, katakana to hiragana, no whitespace). Keys are held in
+    one sorted array, so the entries whose key starts with the query are a binary-search
+    range. If that gives fewer than the requested number of entries, the entries sharing
+    the most bigrams with the query are checked with an edit distance so that typos
+    and matches in the middle of a name are still suggested.
+    """
+    
+    def __init__(self, entries, entry_keys):
+        """Build index from entries and their keys
+        
+        Args:
+            entries: List of entries returned by complete (any objects)
+            entry_keys: List of key lists, one per entry
+        """
+        self.entries = list(entries)
+        
+        keys = []
+        key_entries = []
+        for entry_id, entry_key_list in enumerate(entry_keys):
+            for key in entry_key_list:
+                key = normalize_name(key)
+                if key:
+                    keys.append(key)
+                    key_entries.append(entry_id)
+        
+        # Sorted prefix index (ties by entry order)
+        order = sorted(range(len(keys)), key=lambda k: (keys[k], key_entries[k]))
+        self.sorted_keys = [keys[k] for k in order]
+        self.sorted_entries = np.array([key_entries[k] for k in order], dtype=np.int64)
+        self.sorted_key_lengths = np.array([len(keys[k]) for k in order], dtype=np.int64)
+        
+        # Bigram postings over keys for the fuzzy fallback (unigrams for one-character keys)
+        grams = []
+        gram_keys = []
+        for k, key in enumerate(self.sorted_keys):
+            key_grams = {key[i:i + 2] for i in range(len(key) - 1)} or {key}
+            grams.extend(key_grams)
+            gram_keys.extend([k] * len(key_grams))
+        gram_keys = np.array(gram_keys, dtype=np.int64)
+        codes, uniques = pd.factorize(pd.Series(grams, dtype=object))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self.gram_postings_indptr = dict(zip(uniques.tolist(), zip(bounds[:-1].tolist(), bounds[1:].tolist(), strict=True), strict=True))
+        self.gram_postings = gram_keys[order]
+    
+    @classmethod
+    def from_institution_names(cls, names):
+        """Build completion over distinct institution names
+        
+        Args:
+            names: Iterable of 医療機関名称 (duplicates and missing values are skipped)
+        
+        Returns:
+            CompletionIndex whose entries are the names
+        """
+        names = sorted({name for name in names if isinstance(name, str) and name.strip()})
+        return cls(names, [[name] for name in names])
+    
+    @classmethod
+    def from_filing_options(cls, filing_options):
+        """Build completion over filing types matched by name or symbol
+        
+        Args:
+            filing_options: List of dicts from ShisetsuKijunDataFrame.get_filing_options
+        
+        Returns:
+            CompletionIndex whose entries are the option dicts
+        """
+        return cls(filing_options, [[option['name'], option['symbol']] for option in filing_options])
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def _prefix_entries(self, query, limit):
+        """Get entries with a key starting with query, shortest keys first"""
+        start = bisect_left(self.sorted_keys, query)
+        end = bisect_left(self.sorted_keys, query + PREFIX_RANGE_END, lo=start)
+        key_positions = np.arange(start, end)
+        if end - start > limit:
+            # Only keys no longer than the limit-th shortest one can make the top entries
+            lengths = self.sorted_key_lengths[start:end]
+            max_length = np.partition(lengths, limit - 1)[limit - 1]
+            key_positions = key_positions[lengths <= max_length]
+            key_positions = key_positions[np.argsort(self.sorted_key_lengths[key_positions], kind='stable')]
+        
+        entry_ids = []
+        for entry_id in self.sorted_entries[key_positions].tolist():
+            if entry_id not in entry_ids:
+                entry_ids.append(entry_id)
+                if len(entry_ids) == limit:
+                    break
+        return entry_ids
+    
+    def _fuzzy_entries(self, query, limit, max_distance, exclude):
+        """Get entries within max_distance edits of query (anywhere in the key)"""
+        grams = {query[i:i + 2] for i in range(len(query) - 1)} or {query}
+        ranges = [self.gram_postings_indptr[gram] for gram in grams if gram in self.gram_postings_indptr]
+        if not ranges:
+            return []
+        shared = np.bincount(
+            np.concatenate([self.gram_postings[start:end] for start, end in ranges]),
+            minlength=len(self.sorted_keys),
+        )
+        
+        # Each edit breaks at most two bigrams of the query, so keys sharing fewer can't match
+        min_shared = max(1, len(grams) - 2 * max_distance)
+        candidate_keys = np.flatnonzero(shared >= min_shared)
+        if len(candidate_keys) > FUZZY_CANDIDATES:
+            top = np.argpartition(-shared[candidate_keys], FUZZY_CANDIDATES - 1)[:FUZZY_CANDIDATES]
+            candidate_keys = candidate_keys[top]
+        
+        matches = {}
+        for k in candidate_keys.tolist():
+            entry_id = int(self.sorted_entries[k])
+            if entry_id in exclude:
+                continue
+            distance = substring_edit_distance(query, self.sorted_keys[k])
+            if distance <= max_distance:
+                rank = (distance, -int(shared[k]), len(self.sorted_keys[k]), entry_id)
+                matches[entry_id] = min(rank, matches.get(entry_id, rank))
+        return sorted(matches, key=matches.get)[:limit]
+    
+    def complete(self, query, limit=10, max_distance=None):
+        """Get the top entries completing a query
+        
+        Args:
+            query: Typed text
+            limit: Maximum number of entries
+            max_distance: Largest edit distance of fuzzy matches (default: 1 per
+                FUZZY_CHARS_PER_EDIT characters, so none below that length; 0 disables the fuzzy fallback)
+        
+        Returns:
+            List of entries: prefix matches first (shortest key first), then fuzzy matches
+            (fewest edits first)
+        """
+        query = normalize_name(query)
+        if not query or limit <= 0:
+            return []
+        if max_distance is None:
+            max_distance = len(query) // FUZZY_CHARS_PER_EDIT
+        
+        entry_ids = self._prefix_entries(query, limit)
+        if len(entry_ids) < limit and max_distance > 0:
+            entry_ids += self._fuzzy_entries(query, limit - len(entry_ids), max_distance, set(entry_ids))
+        return [self.entries[entry_id] for entry_id in entry_ids]
@@ -1,5 +1,10 @@
+import numpy as np
 import pandas as pd
-from .shisetsu_kijun import ShisetsuKijunDataFrame
+from .shisetsu_kijun import INSTITUTION_KEY_COLUMNS, ShisetsuKijunDataFrame
+from .filing_incidence import FilingIncidenceMatrix
+
+# Peer group summary columns added by from_jaccard_similarity when peer_count is given
+PEER_SUMMARY_COLUMNS = ['届出医療機関数', '届出率']
 
 
 class ShisetsuKijunFilingCrossTabDataFrame(pd.DataFrame):
@@ -10,7 +15,8 @@ class ShisetsuKijunFilingCrossTabDataFrame(pd.DataFrame):
         return ShisetsuKijunFilingCrossTabDataFrame
     
     @classmethod
-    def from_jaccard_similarity(cls, jaccard_df, source_df, target_institution_name, top_n=20, target_institution_number=None):
+    def from_jaccard_similarity(cls, jaccard_df, source_df, target_institution_name, top_n=20, target_institution_key=None,
+                                incidence=None, peer_count=None, page=0):
         """Create ShisetsuKijunFilingCrossTabDataFrame from JaccardSimilarityDataFrame
         
         Args:
@@ -18,100 +24,100 @@ class ShisetsuKijunFilingCrossTabDataFrame(pd.DataFrame):
             source_df: ShisetsuKijunDataFrame with original data
             target_institution_name: Name of the target institution
             top_n: Number of top similar institutions to include (default: 20)
-            target_institution_number: Optional target institution number (for performance optimization)
+            target_institution_key: Optional (都道府県コード, 医療機関番号) of the target institution
+                (for performance optimization)
+            incidence: Optional FilingIncidenceMatrix built from source_df (built on the fly if omitted)
+            peer_count: Optional number of top similar institutions forming the peer group. When given,
+                the 届出医療機関数/届出率 summary columns cover the whole peer group and only the
+                top_n institutions of the requested page get their own column
+            page: Page of institution columns (0-based, top_n institutions per page) when peer_count is given
             
         Returns:
             ShisetsuKijunFilingCrossTabDataFrame with filing status comparison
         """
+        # Get peer group (top N institutions unless a larger peer group is requested)
+        peer_df = jaccard_df.head(peer_count if peer_count is not None else top_n)
+        peer_institutions = peer_df['医療機関名称'].tolist()
+        
+        if not peer_institutions:
+            return cls()
+        
         # Ensure source_df is ShisetsuKijunDataFrame
         if not isinstance(source_df, ShisetsuKijunDataFrame):
             source_df = ShisetsuKijunDataFrame(source_df)
         
-        # Get top N institutions
-        top_n_df = jaccard_df.head(top_n).copy()
-        top_n_institutions = top_n_df['医療機関名称'].tolist()
-        
-        if not top_n_institutions:
-            return cls()
+        if incidence is None:
+            incidence = FilingIncidenceMatrix.from_shisetsu_kijun(source_df)
         
-        # Pre-compute institution filings by institution number (for performance)
-        institution_filings_by_number = (
-            source_df.groupby('医療機関番号')['受理届出名称']
-            .apply(lambda x: set(x.dropna().unique()))
-            .to_dict()
-        )
-        
-        # Get institution numbers for these institutions
-        institution_number_mapping = (
-            source_df.groupby('医療機関名称')['医療機関番号']
-            .first()
-            .to_dict()
-        )
-        
-        # Create mapping from 受理届出名称 to 受理記号 (1-to-1 relationship)
-        if '受理記号' in source_df.columns:
-            filing_name_to_symbol = (
-                source_df.groupby('受理届出名称')['受理記号']
-                .first()
-                .to_dict()
-            )
-        else:
-            filing_name_to_symbol = {}
-        
-        # Get target institution's number (use provided value if available to avoid redundant filtering)
-        if target_institution_number is None:
+        # Get target institution's key (use provided value if available to avoid redundant filtering)
+        if target_institution_key is None:
             target_institution_data = source_df.filter_by_exact_institution_name(target_institution_name)
             if len(target_institution_data) == 0:
                 return cls()
-            target_institution_number = target_institution_data.iloc[0]['医療機関番号']
-        
-        # Get all filing types (施設基準) from target and top N institutions
-        all_filing_types = set()
+            target_institution_key = tuple(target_institution_data.iloc[0][INSTITUTION_KEY_COLUMNS])
         
-        # Get target institution's filing types
-        target_filing_types = institution_filings_by_number.get(target_institution_number, set())
-        all_filing_types.update(target_filing_types)
+        # Similarity results carry the institution keys; older frames only have names
+        if all(col in peer_df.columns for col in INSTITUTION_KEY_COLUMNS):
+            peer_keys = peer_df[INSTITUTION_KEY_COLUMNS]
+        else:
+            peer_keys = (
+                source_df.groupby('医療機関名称', observed=True)[INSTITUTION_KEY_COLUMNS]
+                .first()
+                .reindex(peer_institutions)
+            )
         
-        # Get top N institutions' filing types
-        for institution_name in top_n_institutions:
-            institution_number = institution_number_mapping.get(institution_name)
-            if institution_number:
-                filing_types = institution_filings_by_number.get(institution_number, set())
-                all_filing_types.update(filing_types)
+        # Slice the filing rows of the target and the peers out of the incidence matrix
+        prefecture_codes = np.concatenate([[target_institution_key[0]], peer_keys['都道府県コード'].to_numpy(dtype=np.float64)])
+        institution_numbers = np.concatenate([[target_institution_key[1]], peer_keys['医療機関番号'].to_numpy(dtype=np.float64)])
+        rows = incidence.get_rows(prefecture_codes, institution_numbers)
+        found = rows >= 0
+        filing_matrix = np.zeros((len(rows), incidence.n_filings), dtype=bool)
+        if found.any():
+            found_rows = rows[found]
+            filing_matrix[found] = incidence.to_dense(found_rows)
+        target_filing_status, peer_filing_matrix = filing_matrix[0], filing_matrix[1:]
+        
+        # Only the institutions of the requested page get a column
+        if peer_count is not None:
+            page_slice = slice(page * top_n, (page + 1) * top_n)
+            column_institutions = peer_institutions[page_slice]
+            column_filing_matrix = peer_filing_matrix[page_slice]
+        else:
+            column_institutions = peer_institutions
+            column_filing_matrix = peer_filing_matrix
         
-        all_filing_types = sorted(list(all_filing_types))
+        # One filing status row per column name (a later institution with the same name replaces the earlier one)
+        filing_status_by_name = dict(zip([target_institution_name] + column_institutions,
+                                         [target_filing_status] + list(column_filing_matrix), strict=True))
         
-        if not all_filing_types:
+        # Keep the filing types (施設基準) held by any of them (ids are in 受理届出名称 order);
+        # with a peer group, rows cover the whole group so that they don't change between pages
+        if peer_count is not None:
+            any_filing_status = target_filing_status | peer_filing_matrix.any(axis=0)
+        else:
+            any_filing_status = np.any(list(filing_status_by_name.values()), axis=0)
+        filing_ids = np.flatnonzero(any_filing_status)
+        if len(filing_ids) == 0:
             return cls()
         
-        # Build data for cross-tabulation
-        rows_data = []
+        # 受理記号 column, then one boolean column per institution (target first)
+        if incidence.filing_symbols is not None:
+            filing_symbols = incidence.filing_symbols[filing_ids]
+        else:
+            filing_symbols = [''] * len(filing_ids)
+        columns = {'受理記号': filing_symbols}
         
-        for filing_type in all_filing_types:
-            row_data = {
-                '受理届出名称': filing_type,
-                '受理記号': filing_name_to_symbol.get(filing_type, '')
-            }
-            
-            # First, add target institution's filing status
-            target_filing_types_set = institution_filings_by_number.get(target_institution_number, set())
-            row_data[target_institution_name] = filing_type in target_filing_types_set
-            
-            # Then, add top N institutions' filing status
-            for institution_name in top_n_institutions:
-                institution_number = institution_number_mapping.get(institution_name)
-                if institution_number:
-                    filing_types_set = institution_filings_by_number.get(institution_number, set())
-                    row_data[institution_name] = filing_type in filing_types_set
-                else:
-                    row_data[institution_name] = False
-            
-            rows_data.append(row_data)
+        # Peer group summary: number and share of peers holding each filing type
+        if peer_count is not None:
+            peer_filing_counts = peer_filing_matrix[:, filing_ids].sum(axis=0)
+            columns['届出医療機関数'] = peer_filing_counts
+            columns['届出率'] = peer_filing_counts / len(peer_institutions)
+        
+        for institution_name, filing_status in filing_status_by_name.items():
+            columns[institution_name] = filing_status[filing_ids]
         
-        # Create DataFrame with 受理届出名称 and 受理記号 as columns
-        cross_tab_df = pd.DataFrame(rows_data)
         # Set 受理届出名称 as index for filtering
-        cross_tab_df = cross_tab_df.set_index('受理届出名称')
+        cross_tab_df = pd.DataFrame(columns, index=pd.Index(incidence.filing_names[filing_ids], name='受理届出名称'))
         
         return cls(cross_tab_df)
     
@@ -142,17 +148,18 @@ class ShisetsuKijunFilingCrossTabDataFrame(pd.DataFrame):
         # Reset index to display 受理届出名称 as a regular column
         display_df = self.reset_index()
         
-        # Get institution columns (excluding 受理届出名称 and 受理記号)
+        # Get institution columns (excluding 受理届出名称, 受理記号 and the peer group summary)
+        summary_columns = [col for col in PEER_SUMMARY_COLUMNS if col in display_df.columns]
         institution_columns = [col for col in display_df.columns 
-                             if col not in ['受理届出名称', '受理記号']]
+                             if col not in ['受理届出名称', '受理記号'] + summary_columns]
         
         # Reorder: target institution first, then others
         if target_institution_name in institution_columns:
             other_institutions = [col for col in institution_columns if col != target_institution_name]
             institution_columns = [target_institution_name] + other_institutions
         
-        # Reorder columns: 受理届出名称, 受理記号, then institution columns
-        display_columns = ['受理届出名称', '受理記号'] + institution_columns
+        # Reorder columns: 受理届出名称, 受理記号, peer group summary, then institution columns
+        display_columns = ['受理届出名称', '受理記号'] + summary_columns + institution_columns
         display_df = display_df[display_columns]
         
         return display_df
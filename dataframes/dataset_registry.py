@@ -0,0 +1,268 @@
+import re
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .shisetsu_kijun import ShisetsuKijunDataFrame, get_companion_file_path
+
+# Monthly datasets live in data/YYYY/MM
+MONTH_DIR_PATTERN = re.compile(r'^\d{4}$|^\d{2}$')
+
+# Companion tables of a normalized bundle (see create_feather.py); any of them marks a dataset
+NORMALIZED_TABLE_NAMES = ['institutions', 'filing_types', 'filings']
+
+# Dataset file preferred when a month directory holds several
+DEFAULT_DATASET_STEM = 'all'
+
+# Number of values sampled per object column when estimating memory usage
+MEMORY_SAMPLE_SIZE = 1000
+
+
+def load_dataset(file_path):
+    """Load a dataset (normalized tables if available, otherwise the flat file)
+    
+    Args:
+        file_path: Flat feather file path (e.g. data/2025/10/all.feather); it may not exist
+            if only the normalized tables were kept
+    
+    Returns:
+        ShisetsuKijunDataFrame in compact mode
+    """
+    if get_companion_file_path(file_path, 'institutions').exists():
+        return ShisetsuKijunDataFrame.from_normalized(file_path, compact=True)
+    return ShisetsuKijunDataFrame.from_feather(file_path, compact=True)
+
+
+def get_dataset_fingerprint(file_path):
+    """Get a fingerprint of the files a dataset is loaded from (see load_dataset)
+    
+    Derived files (e.g. the neighbour table of create_neighbours.py) record it so that
+    they can be recognized as stale once create_feather.py rewrites the dataset.
+    
+    Args:
+        file_path: Flat feather file path (e.g. data/2025/10/all.feather)
+    
+    Returns:
+        String of the names, sizes and modification times of the files
+    """
+    if get_companion_file_path(file_path, 'institutions').exists():
+        paths = [get_companion_file_path(file_path, name) for name in NORMALIZED_TABLE_NAMES]
+    else:
+        paths = [Path(file_path)]
+    parts = []
+    for path in paths:
+        stat = path.stat()
+        parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return ';'.join(parts)
+
+
+def estimate_nbytes(obj):
+    """Estimate memory used by a loaded resource
+    
+    DataFrames count their column buffers plus, for object columns, the mean size of a
+    sample of values (exact deep accounting takes seconds on a full dataset). Other
+    objects count the numpy arrays and DataFrames among their attributes, lists and dicts.
+    
+    Args:
+        obj: DataFrame, numpy array, or object holding them
+    
+    Returns:
+        Estimated size in bytes
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        nbytes = int(obj.memory_usage(index=True, deep=False).sum())
+        for col in [col for col in obj.columns if pd.api.types.is_object_dtype(obj[col].dtype)]:
+            values = obj[col].to_numpy()
+            sample = values[::max(1, len(values) // MEMORY_SAMPLE_SIZE)]
+            if len(sample) > 0:
+                nbytes += int(np.mean([sys.getsizeof(value) for value in sample]) * len(values))
+        return nbytes
+    if isinstance(obj, pd.Series):
+        return estimate_nbytes(obj.to_frame())
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(estimate_nbytes(value) for value in obj.values() if isinstance(value, (np.ndarray, pd.DataFrame)))
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_nbytes(value) for value in obj if isinstance(value, (np.ndarray, pd.DataFrame)))
+    if hasattr(obj, '__dict__'):
+        return sum(
+            estimate_nbytes(value) for value in vars(obj).values()
+            if isinstance(value, (np.ndarray, pd.DataFrame, dict, list, tuple))
+        )
+    return sys.getsizeof(obj)
+
+
+class DatasetRegistry:
+    """Registry of the monthly datasets under a data directory
+    
+    Every data/YYYY/MM directory with a flat feather file or a normalized bundle is a
+    dataset, keyed by "YYYY/MM". Datasets are loaded on first use, together with the
+    resources derived from them (incidence matrix, indexes, ...), and the most recently
+    used months are kept in memory: when more than max_datasets months are resident or
+    their estimated size exceeds max_bytes, the least recently used months are evicted.
+    The month in use is never evicted.
+    
+    The registry is shared by all sessions. Its bookkeeping is guarded by one lock, but
+    resources are created outside it: only callers of the same (month, resource) wait
+    for a load in progress, so sessions using other resident data are not blocked.
+    """
+    
+    def __init__(self, data_dir='data', max_datasets=2, max_bytes=None):
+        """Create registry over a data directory
+        
+        Args:
+            data_dir: Directory holding YYYY/MM subdirectories
+            max_datasets: Maximum number of months kept in memory
+            max_bytes: Optional memory budget of the resident months in bytes
+        """
+        self.data_dir = Path(data_dir)
+        self.max_datasets = max_datasets
+        self.max_bytes = max_bytes
+        # month -> {resource name: (value, estimated bytes)}, least recently used first
+        self._resident = OrderedDict()
+        self._lock = threading.RLock()
+        # (month, resource name) -> lock held while the resource is being created
+        self._loading_locks = {}
+    
+    def discover(self):
+        """Find the dataset file of every month
+        
+        Returns:
+            Dict mapping "YYYY/MM" to the flat feather file path, sorted by month
+        """
+        datasets = {}
+        for month_dir in sorted(self.data_dir.glob('*/*')):
+            year, month = month_dir.parent.name, month_dir.name
+            if not (month_dir.is_dir() and MONTH_DIR_PATTERN.match(year) and MONTH_DIR_PATTERN.match(month)):
+                continue
+            file_path = self._find_dataset_file(month_dir)
+            if file_path is not None:
+                datasets[f"{year}/{month}"] = file_path
+        return datasets
+    
+    @staticmethod
+    def _find_dataset_file(month_dir):
+        """Get the flat feather file path of a month directory (None if it has no dataset)"""
+        feather_stems = {path.stem for path in month_dir.glob('*.feather')}
+        stems = set()
+        for stem in feather_stems:
+            # A normalized bundle is a dataset even without its flat file
+            for name in NORMALIZED_TABLE_NAMES:
+                if stem.endswith(f"_{name}"):
+                    stems.add(stem[:-len(name) - 1])
+        # Flat files that are not companions of another dataset file
+        stems |= {
+            stem for stem in feather_stems
+            if not any(stem.startswith(f"{other}_") for other in feather_stems if other != stem)
+        }
+        if not stems:
+            return None
+        stem = DEFAULT_DATASET_STEM if DEFAULT_DATASET_STEM in stems else sorted(stems)[0]
+        return month_dir / f"{stem}.feather"
+    
+    def get_months(self):
+        """Get available months, latest first"""
+        return sorted(self.discover(), reverse=True)
+    
+    def get_file_path(self, month):
+        """Get the flat feather file path of a month
+        
+        Raises:
+            KeyError: If the month has no dataset
+        """
+        datasets = self.discover()
+        if month not in datasets:
+            raise KeyError(f"No dataset for {month} in {self.data_dir}")
+        return datasets[month]
+    
+    def get_resource(self, month, name, factory):
+        """Get a resource of a month, creating it on first use
+        
+        Args:
+            month: Month key ("YYYY/MM")
+            name: Resource name (e.g. 'raw_data', 'filing_incidence')
+            factory: Function called with the dataset file path to create the resource
+        
+        Returns:
+            Resource value (kept until the month is evicted)
+        """
+        with self._lock:
+            resources = self._resident.get(month)
+            if resources is not None and name in resources:
+                self._resident.move_to_end(month)
+                return resources[name][0]
+            loading_lock = self._loading_locks.setdefault((month, name), threading.Lock())
+        
+        # One caller creates the resource; the others for the same key wait and reuse it
+        with loading_lock:
+            with self._lock:
+                resources = self._resident.get(month)
+                if resources is not None and name in resources:
+                    self._resident.move_to_end(month)
+                    return resources[name][0]
+            
+            try:
+                value = factory(self.get_file_path(month))
+                nbytes = estimate_nbytes(value)
+            except BaseException:
+                with self._lock:
+                    self._loading_locks.pop((month, name), None)
+                raise
+            
+            # Publish before releasing the key so later callers find the resource resident
+            with self._lock:
+                self._resident.setdefault(month, {})[name] = (value, nbytes)
+                self._resident.move_to_end(month)
+                self._evict(keep=month)
+                self._loading_locks.pop((month, name), None)
+            return value
+    
+    def get_raw_data(self, month):
+        """Get the ShisetsuKijunDataFrame of a month"""
+        return self.get_resource(month, 'raw_data', load_dataset)
+    
+    def _evict(self, keep):
+        """Evict least recently used months beyond max_datasets or max_bytes (except keep)"""
+        while len(self._resident) > 1:
+            over_count = len(self._resident) > self.max_datasets
+            over_bytes = self.max_bytes is not None and self.get_total_bytes() > self.max_bytes
+            if not (over_count or over_bytes):
+                break
+            month = next(iter(self._resident))
+            if month == keep:
+                break
+            del self._resident[month]
+    
+    def evict(self, month):
+        """Drop a month and its resources from memory"""
+        with self._lock:
+            self._resident.pop(month, None)
+    
+    def get_resident_months(self):
+        """Get months in memory, least recently used first"""
+        with self._lock:
+            return list(self._resident)
+    
+    def get_memory_usage(self):
+        """Get estimated memory of the resident months
+        
+        Returns:
+            Dict mapping month to {resource name: estimated bytes}
+        """
+        with self._lock:
+            return {
+                month: {name: nbytes for name, (_, nbytes) in resources.items()}
+                for month, resources in self._resident.items()
+            }
+    
+    def get_total_bytes(self):
+        """Get estimated memory of all resident months in bytes"""
+        with self._lock:
+            return sum(nbytes for resources in self._resident.values() for _, nbytes in resources.values())
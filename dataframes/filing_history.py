@@ -0,0 +1,276 @@
+import os
+import re
+from pathlib import Path
+
+import pandas as pd
+
+from .shisetsu_kijun import FILING_COLUMNS, INSTITUTION_KEY_COLUMNS
+
+# A filing is identified by 都道府県コード, 医療機関番号 and 受理番号 (the primary key of create_feather.py
+# output; 医療機関番号 alone is only unique within a prefecture)
+FILING_KEY_COLUMNS = INSTITUTION_KEY_COLUMNS + ['受理番号']
+
+# Month keys of the store ("YYYY/MM")
+MONTH_KEY_PATTERN = re.compile(r'^\d{4}/\d{2}$')
+
+# Change kinds recorded in the 変更種別 column of the deltas
+CHANGE_ADDED = 'added'
+CHANGE_WITHDRAWN = 'withdrawn'
+CHANGE_CHANGED = 'changed'
+
+# Files of the store: first month in full, one delta per later month, and the latest month in full
+SNAPSHOT_FILE_PREFIX = 'snapshot_'
+DELTA_FILE_PREFIX = 'delta_'
+LATEST_FILE_NAME = 'latest.feather'
+# Files are written under this suffix and renamed into place
+TEMP_FILE_SUFFIX = '.tmp'
+
+
+def get_history_columns(df):
+    """Get the columns of a filings DataFrame tracked by the history store (keys first)"""
+    value_columns = [
+        col for col in INSTITUTION_KEY_COLUMNS + FILING_COLUMNS
+        if col in df.columns and col not in FILING_KEY_COLUMNS
+    ]
+    return FILING_KEY_COLUMNS + value_columns
+
+
+def month_to_file_token(month):
+    """Convert a month key to a file name part (e.g. "2025/10" -> "2025_10")"""
+    return month.replace('/', '_')
+
+
+def file_token_to_month(token):
+    """Convert a file name part back to a month key (e.g. "2025_10" -> "2025/10")"""
+    return token.replace('_', '/')
+
+
+class FilingHistoryStore:
+    """Longitudinal store of the filings of monthly rosters, encoded as monthly deltas
+    
+    The first month is kept as a full snapshot; every later month is a delta against
+    the month before: filings added (new 都道府県コード, 医療機関番号 and 受理番号 keys),
+    withdrawn, and changed (算定開始年月日 or any other tracked column differs). The latest
+    month is also kept in full so appending a month reads one snapshot, not the whole history.
+    Storage and append cost therefore grow with the monthly churn, "what changed in a
+    month" is a read of that month's delta file, and any month can be reconstructed
+    by applying the deltas to the first snapshot.
+    
+    Tracked columns are the filing columns of create_feather.py output (FILING_COLUMNS)
+    plus the institution key; institution attributes are kept in each month's own dataset.
+    
+    Every file is written to a temporary path and renamed into place. latest.feather records
+    its month (attrs['month']) and is only used while it matches the last month of the store,
+    so an interrupted append never leaves a store whose months disagree.
+    """
+    
+    def __init__(self, store_dir):
+        """Open a store directory (created on first append)
+        
+        Args:
+            store_dir: Directory of the store files (e.g. data/history)
+        """
+        self.store_dir = Path(store_dir)
+    
+    def _get_path(self, prefix, month):
+        return self.store_dir / f"{prefix}{month_to_file_token(month)}.feather"
+    
+    @staticmethod
+    def _write(files):
+        """Write DataFrames to temporary paths, then rename them into place
+        
+        Args:
+            files: List of (DataFrame, path) pairs, renamed in order
+        """
+        for df, path in files:
+            df.to_feather(path.with_name(path.name + TEMP_FILE_SUFFIX))
+        for _, path in files:
+            os.replace(path.with_name(path.name + TEMP_FILE_SUFFIX), path)
+    
+    def _read_latest(self, month):
+        """Get latest.feather if it holds the month (None if missing or stale)"""
+        latest_path = self.store_dir / LATEST_FILE_NAME
+        if not latest_path.exists():
+            return None
+        latest = pd.read_feather(latest_path)
+        return latest if latest.attrs.get('month') == month else None
+    
+    def get_months(self):
+        """Get months in the store, oldest first"""
+        months = [
+            file_token_to_month(path.stem[len(prefix):])
+            for prefix in [SNAPSHOT_FILE_PREFIX, DELTA_FILE_PREFIX]
+            for path in self.store_dir.glob(f"{prefix}*.feather")
+        ]
+        return sorted(months)
+    
+    @staticmethod
+    def _to_snapshot(df):
+        """Get tracked columns of a filings DataFrame, one row per filing, sorted by key"""
+        snapshot = df[get_history_columns(df)].drop_duplicates(subset=FILING_KEY_COLUMNS, keep='first')
+        snapshot = snapshot.astype({col: object for col in snapshot.columns if isinstance(snapshot[col].dtype, pd.CategoricalDtype)})
+        return snapshot.sort_values(FILING_KEY_COLUMNS, kind='stable').reset_index(drop=True)
+    
+    @staticmethod
+    def compute_delta(previous, current):
+        """Compute the changes between two snapshots
+        
+        Args:
+            previous: Snapshot of the earlier month
+            current: Snapshot of the later month (same columns)
+        
+        Returns:
+            DataFrame with 変更種別, the tracked columns (values of the later month, or of the
+            earlier month for withdrawn filings) and 変更前算定開始年月日, sorted by key
+        """
+        value_columns = [col for col in current.columns if col not in FILING_KEY_COLUMNS]
+        merged = previous.merge(current, on=FILING_KEY_COLUMNS, how='outer', suffixes=('_前', ''), indicator=True)
+        
+        # Changed: any tracked value differs (missing on both sides counts as equal)
+        differs = pd.Series(False, index=merged.index)
+        for col in value_columns:
+            before, after = merged[f"{col}_前"], merged[col]
+            differs |= ~((before == after) | (before.isna() & after.isna()))
+        
+        kinds = pd.Series(pd.NA, index=merged.index, dtype=object)
+        kinds[merged['_merge'] == 'right_only'] = CHANGE_ADDED
+        kinds[merged['_merge'] == 'left_only'] = CHANGE_WITHDRAWN
+        kinds[(merged['_merge'] == 'both') & differs] = CHANGE_CHANGED
+        
+        # Withdrawn filings keep their last values
+        withdrawn = kinds == CHANGE_WITHDRAWN
+        for col in value_columns:
+            merged.loc[withdrawn, col] = merged.loc[withdrawn, f"{col}_前"]
+        
+        delta = merged[FILING_KEY_COLUMNS + value_columns].copy()
+        delta.insert(0, '変更種別', kinds)
+        if '算定開始年月日' in previous.columns:
+            delta['変更前算定開始年月日'] = merged['算定開始年月日_前'].where(kinds == CHANGE_CHANGED)
+        delta = delta[kinds.notna()]
+        return delta.sort_values(FILING_KEY_COLUMNS, kind='stable').reset_index(drop=True)
+    
+    @staticmethod
+    def apply_delta(snapshot, delta):
+        """Apply a delta to the snapshot of the month before it
+        
+        Args:
+            snapshot: Snapshot of the earlier month
+            delta: Delta from compute_delta
+        
+        Returns:
+            Snapshot of the later month
+        """
+        # Drop withdrawn and changed filings, then add the added and changed ones
+        removed_keys = delta.loc[delta['変更種別'] != CHANGE_ADDED, FILING_KEY_COLUMNS]
+        kept = snapshot.merge(removed_keys, on=FILING_KEY_COLUMNS, how='left', indicator=True)
+        kept = kept[kept['_merge'] == 'left_only'].drop(columns='_merge')
+        added = delta.loc[delta['変更種別'] != CHANGE_WITHDRAWN, snapshot.columns]
+        
+        result = pd.concat([kept, added], ignore_index=True)
+        return result.sort_values(FILING_KEY_COLUMNS, kind='stable').reset_index(drop=True)
+    
+    def check_month(self, month):
+        """Check that a month can be appended to the store
+        
+        Args:
+            month: Month key ("YYYY/MM"); later than every month in the store, or the
+                latest month itself (which is then replaced)
+        
+        Raises:
+            ValueError: If the month key is malformed or earlier than the latest month in the store
+        """
+        if not MONTH_KEY_PATTERN.match(month):
+            raise ValueError(f"Month {month} must be formatted as YYYY/MM")
+        months = self.get_months()
+        if months and month < months[-1]:
+            raise ValueError(f"Month {month} must not be earlier than the latest month in the store ({months[-1]})")
+    
+    def append_month(self, month, df):
+        """Append a month to the store, or replace the latest month
+        
+        Args:
+            month: Month key ("YYYY/MM"); later than every month in the store, or the
+                latest month itself to rebuild it (its delta is recomputed against the month before)
+            df: Filings DataFrame of the month (create_feather.py output, one row per filing)
+        
+        Returns:
+            Delta of the month (or the full snapshot for the first month of the store)
+        
+        Raises:
+            ValueError: If the month key is malformed or earlier than the latest month in the store
+        """
+        self.check_month(month)
+        months = self.get_months()
+        previous_months = [m for m in months if m < month]
+        
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        snapshot = self._to_snapshot(df)
+        if not previous_months:
+            result = snapshot
+            files = [(snapshot, self._get_path(SNAPSHOT_FILE_PREFIX, month))]
+        else:
+            previous = self._read_latest(previous_months[-1])
+            if previous is None:
+                previous = self.reconstruct(previous_months[-1])
+            result = self.compute_delta(previous, snapshot)
+            files = [(result, self._get_path(DELTA_FILE_PREFIX, month))]
+        
+        # latest.feather goes last: until it is renamed it still names the month before
+        latest = snapshot.copy()
+        latest.attrs['month'] = month
+        self._write(files + [(latest, self.store_dir / LATEST_FILE_NAME)])
+        return result
+    
+    def get_changes(self, month, change_kinds=None, institution_key=None):
+        """Get the filings changed between a month and the month before it
+        
+        Args:
+            month: Month key ("YYYY/MM"); not the first month of the store
+            change_kinds: Optional list of change kinds (CHANGE_ADDED, CHANGE_WITHDRAWN, CHANGE_CHANGED)
+            institution_key: Optional (都道府県コード, 医療機関番号) to look up (binary search on the sorted key)
+        
+        Returns:
+            Delta DataFrame of the month (see compute_delta)
+        
+        Raises:
+            KeyError: If the store has no delta for the month
+        """
+        delta_path = self._get_path(DELTA_FILE_PREFIX, month)
+        if not delta_path.exists():
+            raise KeyError(f"No changes recorded for {month} in {self.store_dir}")
+        delta = pd.read_feather(delta_path)
+        
+        if institution_key is not None:
+            # Narrow the range one key column at a time (rows are sorted by FILING_KEY_COLUMNS)
+            start, end = 0, len(delta)
+            for col, value in zip(INSTITUTION_KEY_COLUMNS, institution_key, strict=True):
+                values = delta[col].iloc[start:end]
+                start, end = start + values.searchsorted(value, side='left'), start + values.searchsorted(value, side='right')
+            delta = delta.iloc[start:end]
+        if change_kinds is not None:
+            delta = delta[delta['変更種別'].isin(change_kinds)]
+        return delta.reset_index(drop=True)
+    
+    def reconstruct(self, month):
+        """Reconstruct the filings of a month
+        
+        Args:
+            month: Month key ("YYYY/MM")
+        
+        Returns:
+            Snapshot DataFrame (tracked columns, one row per filing, sorted by key)
+        
+        Raises:
+            KeyError: If the month is not in the store
+        """
+        months = self.get_months()
+        if month not in months:
+            raise KeyError(f"No filings recorded for {month} in {self.store_dir}")
+        latest = self._read_latest(month)
+        if latest is not None:
+            return latest
+        
+        snapshot = pd.read_feather(self._get_path(SNAPSHOT_FILE_PREFIX, months[0]))
+        for delta_month in months[1:months.index(month) + 1]:
+            snapshot = self.apply_delta(snapshot, pd.read_feather(self._get_path(DELTA_FILE_PREFIX, delta_month)))
+        return snapshot
@@ -0,0 +1,372 @@
+import numpy as np
+import pandas as pd
+
+from .bed_index import BedCountIndex
+from .shisetsu_kijun import INSTITUTION_KEY_COLUMNS
+
+# 医療機関番号 has at most 7 digits, so (都道府県コード, 医療機関番号) packs into one sortable integer
+INSTITUTION_NUMBER_RADIX = 10 ** 7
+
+
+def get_institution_keys(prefecture_codes, institution_numbers):
+    """Pack (都道府県コード, 医療機関番号) pairs into int64 institution keys
+    
+    医療機関番号 is only unique within a prefecture, so institutions are identified by
+    both columns; the packed key sorts like the pair.
+    
+    Args:
+        prefecture_codes: Array-like of 都道府県コード
+        institution_numbers: Array-like of 医療機関番号 (same length)
+    
+    Returns:
+        int64 array of keys (-1 where either value is missing)
+    """
+    keys = (
+        np.asarray(prefecture_codes, dtype=np.float64) * INSTITUTION_NUMBER_RADIX
+        + np.asarray(institution_numbers, dtype=np.float64)
+    )
+    return np.where(np.isnan(keys), -1, keys).astype(np.int64)
+
+
+class FilingIncidenceMatrix:
+    """Sparse institution × filing type incidence matrix in CSR layout
+    
+    Rows are institutions (sorted by 都道府県コード and 医療機関番号, see INSTITUTION_KEY_COLUMNS)
+    and columns are filing types (sorted by 受理届出名称). The filing type ids of row r are
+    indices[indptr[r]:indptr[r + 1]] in ascending order.
+    
+    Built once per dataset and shared by the similarity and cross-tabulation analyses,
+    so they don't have to group the filings by institution on every call.
+    The transposed (CSC) layout is built on first use as an inverted index: the
+    institution rows of filing type f are postings[postings_indptr[f]:postings_indptr[f + 1]].
+    """
+    
+    def __init__(self, prefecture_codes, institution_numbers, filing_names, indptr, indices,
+                 institution_names=None, bed_counts=None, filing_symbols=None):
+        """Create incidence matrix from CSR arrays
+        
+        Args:
+            prefecture_codes: Array of 都道府県コード (one per row)
+            institution_numbers: Array of 医療機関番号 (one per row; rows sorted by both columns)
+            filing_names: Sorted array of 受理届出名称 (one per column)
+            indptr: Row pointer array of length len(institution_numbers) + 1
+            indices: Column (filing type id) array
+            institution_names: Optional array of 医療機関名称 aligned with rows
+            bed_counts: Optional array of 病床数 dicts aligned with rows
+            filing_symbols: Optional array of 受理記号 aligned with columns
+        """
+        self.prefecture_codes = np.asarray(prefecture_codes)
+        self.institution_numbers = np.asarray(institution_numbers)
+        self.institution_keys = get_institution_keys(self.prefecture_codes, self.institution_numbers)
+        self.filing_names = np.asarray(filing_names, dtype=object)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.institution_names = institution_names
+        self.bed_counts = bed_counts
+        self.filing_symbols = filing_symbols
+        
+        # Number of filing types per institution and row id of every stored entry
+        self.row_sizes = np.diff(self.indptr)
+        self.row_ids = np.repeat(np.arange(len(self.institution_numbers), dtype=np.int32), self.row_sizes)
+        self._bed_types = None
+        self._bed_index = None
+        self._postings_indptr = None
+        self._postings = None
+        self._idf_weights = None
+    
+    @classmethod
+    def from_shisetsu_kijun(cls, df):
+        """Build incidence matrix from ShisetsuKijunDataFrame
+        
+        Args:
+            df: ShisetsuKijunDataFrame (one row per filing)
+        
+        Returns:
+            FilingIncidenceMatrix instance
+        """
+        df = df[df[INSTITUTION_KEY_COLUMNS].notna().all(axis=1)]
+        
+        # One row per (都道府県コード, 医療機関番号), in key order
+        rows, institution_keys = pd.factorize(
+            get_institution_keys(df['都道府県コード'], df['医療機関番号']), sort=True
+        )
+        _, first_positions = np.unique(rows, return_index=True)
+        
+        # Institution attributes: first name (as groupby first) and first bed count row
+        institution_names = df['医療機関名称'].groupby(rows).first()
+        
+        bed_counts = None
+        if '病床数' in df.columns:
+            bed_counts = df['病床数'].to_numpy(dtype=object)[first_positions]
+        
+        # Distinct (institution, filing type) pairs
+        has_filing = df['受理届出名称'].notna().to_numpy()
+        filing_ids, filing_names = pd.factorize(df['受理届出名称'][has_filing].astype(object), sort=True)
+        rows = rows[has_filing]
+        
+        # Sort by (row, column) and drop duplicated pairs
+        order = np.lexsort((filing_ids, rows))
+        rows = rows[order]
+        filing_ids = filing_ids[order]
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]) | (filing_ids[1:] != filing_ids[:-1])
+        rows = rows[keep]
+        filing_ids = filing_ids[keep]
+        
+        indptr = np.zeros(len(institution_keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(institution_keys)), out=indptr[1:])
+        
+        filing_symbols = None
+        if '受理記号' in df.columns:
+            # 受理届出名称 to 受理記号 is 1-to-1 (take the first symbol)
+            filing_symbols = (
+                df.groupby('受理届出名称', observed=True)['受理記号']
+                .first()
+                .reindex(filing_names)
+                .to_numpy(dtype=object)
+            )
+        
+        return cls(
+            df['都道府県コード'].to_numpy()[first_positions],
+            df['医療機関番号'].to_numpy()[first_positions],
+            filing_names,
+            indptr,
+            filing_ids,
+            institution_names=institution_names.to_numpy(dtype=object),
+            bed_counts=bed_counts,
+            filing_symbols=filing_symbols,
+        )
+    
+    @property
+    def n_institutions(self):
+        """Number of institutions (rows)"""
+        return len(self.institution_numbers)
+    
+    @property
+    def n_filings(self):
+        """Number of filing types (columns)"""
+        return len(self.filing_names)
+    
+    def get_rows(self, prefecture_codes, institution_numbers):
+        """Get row positions for institutions
+        
+        Args:
+            prefecture_codes: Array-like of 都道府県コード
+            institution_numbers: Array-like of 医療機関番号 (same length)
+        
+        Returns:
+            Array of row positions (-1 for unknown institutions)
+        """
+        keys = get_institution_keys(prefecture_codes, institution_numbers)
+        if self.n_institutions == 0:
+            return np.full(len(keys), -1)
+        rows = np.minimum(np.searchsorted(self.institution_keys, keys), self.n_institutions - 1)
+        return np.where((self.institution_keys[rows] == keys) & (keys >= 0), rows, -1)
+    
+    def get_row(self, prefecture_code, institution_number):
+        """Get row position for an institution, or None if unknown"""
+        row = self.get_rows([prefecture_code], [institution_number])[0]
+        return int(row) if row >= 0 else None
+    
+    def get_filing_ids(self, filing_names):
+        """Get column ids for filing names
+        
+        Args:
+            filing_names: Array-like of 受理届出名称
+        
+        Returns:
+            Array of filing type ids (-1 for unknown names)
+        """
+        filing_names = np.asarray(filing_names, dtype=object)
+        if self.n_filings == 0:
+            return np.full(len(filing_names), -1)
+        ids = np.minimum(np.searchsorted(self.filing_names, filing_names), self.n_filings - 1)
+        return np.where(self.filing_names[ids] == filing_names, ids, -1)
+    
+    def get_row_filing_ids(self, row):
+        """Get filing type ids of a row"""
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+    
+    def _build_postings(self):
+        """Build the inverted index (filing type id -> sorted institution rows)"""
+        if self._postings is None:
+            # Stable sort by column keeps the rows of every posting list in ascending order
+            order = np.argsort(self.indices, kind='stable')
+            self._postings = self.row_ids[order]
+            self._postings_indptr = np.zeros(self.n_filings + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=self.n_filings), out=self._postings_indptr[1:])
+    
+    def get_postings(self, filing_id):
+        """Get sorted row positions of the institutions that have a filing type"""
+        self._build_postings()
+        return self._postings[self._postings_indptr[filing_id]:self._postings_indptr[filing_id + 1]]
+    
+    def count_overlaps(self, filing_ids, weights=None):
+        """Count how many of the given filing types each institution has
+        
+        Only the posting lists of the given filing types are visited, so institutions
+        sharing none of them cost nothing.
+        
+        Args:
+            filing_ids: Array-like of distinct filing type ids (e.g. the target's filings)
+            weights: Optional weights aligned with filing_ids (sums the weights instead of counting)
+        
+        Returns:
+            Int array of length n_institutions (|A ∩ B| when filing_ids is the set A),
+            or float array of weighted sums when weights are given
+        """
+        self._build_postings()
+        filing_ids = np.asarray(filing_ids, dtype=np.int64)
+        starts = self._postings_indptr[filing_ids]
+        sizes = self._postings_indptr[filing_ids + 1] - starts
+        total = int(sizes.sum())
+        offsets = np.repeat(starts - (np.cumsum(sizes) - sizes), sizes) + np.arange(total)
+        if weights is not None:
+            weights = np.repeat(np.asarray(weights, dtype=np.float64), sizes)
+        return np.bincount(self._postings[offsets], weights=weights, minlength=self.n_institutions)
+    
+    def get_idf_weights(self):
+        """Get inverse document frequency weights of the filing types
+        
+        A filing type held by df of the N institutions with filings weighs log(N / df),
+        so rare specialist filings count more than near-universal ones.
+        
+        Returns:
+            Tuple of (float array of weights per filing type,
+            float array of each institution's total weight), cached
+        """
+        if self._idf_weights is None:
+            n_documents = max(int(np.count_nonzero(self.row_sizes)), 1)
+            document_frequencies = np.bincount(self.indices, minlength=self.n_filings)
+            with np.errstate(divide='ignore'):
+                weights = np.where(document_frequencies > 0, np.log(n_documents / document_frequencies), 0.0)
+            self._idf_weights = (weights, self.dot(weights))
+        return self._idf_weights
+    
+    def get_bed_types(self):
+        """Get sorted bed type names of each institution (keys of its 病床数 dict)
+        
+        Returns:
+            List of bed type lists aligned with rows (cached)
+        """
+        if self._bed_types is None:
+            bed_counts = self.bed_counts if self.bed_counts is not None else [None] * self.n_institutions
+            self._bed_types = [
+                sorted(bt for bt in (str(k).strip() for k in bed_count if k is not None) if bt)
+                if isinstance(bed_count, dict) else []
+                for bed_count in bed_counts
+            ]
+        return self._bed_types
+    
+    def get_bed_index(self):
+        """Get bed type and bed count index of the institutions (from their 病床数 dicts)
+        
+        Returns:
+            BedCountIndex aligned with rows (cached)
+        """
+        if self._bed_index is None:
+            bed_counts = self.bed_counts if self.bed_counts is not None else [None] * self.n_institutions
+            self._bed_index = BedCountIndex.from_bed_count_dicts(bed_counts)
+        return self._bed_index
+    
+    def dot(self, vector):
+        """Multiply the incidence matrix by a vector over filing types
+        
+        Args:
+            vector: Array of length n_filings (e.g. 0/1 indicator of the target's filings)
+        
+        Returns:
+            Float array of length n_institutions with the sum of vector over each row's filings
+        """
+        return np.bincount(self.row_ids, weights=np.asarray(vector, dtype=np.float64)[self.indices], minlength=self.n_institutions)
+    
+    def gather(self, rows):
+        """Gather the stored entries of the given rows
+        
+        Args:
+            rows: Array-like of row positions
+        
+        Returns:
+            Tuple of (positions into rows, filing type ids), one element per stored entry
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        sizes = self.row_sizes[rows]
+        total = int(sizes.sum())
+        # Offset of every entry in indices: row start + position within the row
+        block_starts = np.cumsum(sizes) - sizes
+        offsets = np.repeat(self.indptr[rows] - block_starts, sizes) + np.arange(total)
+        return np.repeat(np.arange(len(rows)), sizes), self.indices[offsets]
+    
+    def to_dense(self, rows):
+        """Get dense boolean matrix for the given rows
+        
+        Args:
+            rows: Array-like of row positions
+        
+        Returns:
+            Boolean array of shape (len(rows), n_filings)
+        """
+        positions, filing_ids = self.gather(rows)
+        dense = np.zeros((len(np.atleast_1d(rows)), self.n_filings), dtype=bool)
+        dense[positions, filing_ids] = True
+        return dense
+
+
+class FilingRowIndex:
+    """Inverted index from 受理届出名称 / 受理記号 to row positions of a ShisetsuKijunDataFrame
+    
+    Lets filing searches gather the matching rows from the posting lists
+    instead of comparing the whole column on every query.
+    """
+    
+    def __init__(self, name_postings, symbol_postings):
+        """Create index from posting dicts
+        
+        Args:
+            name_postings: Dict mapping 受理届出名称 to sorted array of row positions
+            symbol_postings: Dict mapping 受理記号 to sorted array of row positions
+        """
+        self.name_postings = name_postings
+        self.symbol_postings = symbol_postings
+    
+    @classmethod
+    def from_shisetsu_kijun(cls, df):
+        """Build index from ShisetsuKijunDataFrame
+        
+        Args:
+            df: ShisetsuKijunDataFrame (one row per filing)
+        
+        Returns:
+            FilingRowIndex instance
+        """
+        return cls(
+            cls._build_postings(df['受理届出名称']) if '受理届出名称' in df.columns else {},
+            cls._build_postings(df['受理記号']) if '受理記号' in df.columns else {},
+        )
+    
+    @staticmethod
+    def _build_postings(values):
+        """Group row positions by value (missing values are not indexed)"""
+        codes, uniques = pd.factorize(values)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        return {
+            value: order[start:end]
+            for value, start, end in zip(uniques.tolist(), bounds[:-1].tolist(), bounds[1:].tolist(), strict=True)
+        }
+    
+    def get_positions(self, filing_name, filing_symbol=None):
+        """Get row positions of filings matching the name or the symbol
+        
+        Args:
+            filing_name: Facility criteria name (受理届出名称)
+            filing_symbol: Optional facility criteria symbol (受理記号)
+        
+        Returns:
+            Sorted array of row positions
+        """
+        empty = np.empty(0, dtype=np.int64)
+        positions = self.name_postings.get(filing_name, empty)
+        if filing_symbol:
+            positions = np.union1d(positions, self.symbol_postings.get(filing_symbol, empty))
+        return positions
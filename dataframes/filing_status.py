@@ -1,6 +1,29 @@
+import numpy as np
 import pandas as pd
+from .filing_incidence import get_institution_keys
 from .shisetsu_kijun import ShisetsuKijunDataFrame
 
+# Filing status is counted per (受理届出名称, 受理記号): two names have distinct medical/pharmacy symbols
+FILING_STATUS_COLUMNS = ['受理届出名称', '受理記号']
+
+
+def get_row_institution_keys(df):
+    """Get the institution key of every row of a filings DataFrame
+    
+    医療機関番号 is only unique within a prefecture, so institutions are identified by
+    the packed (都道府県コード, 医療機関番号) key of the incidence matrix.
+    
+    Returns:
+        int64 array aligned with df (-1 where either value is missing)
+    """
+    return get_institution_keys(df['都道府県コード'], df['医療機関番号'])
+
+
+def count_institutions(df):
+    """Count distinct institutions of a filings DataFrame (rows without a key are not counted)"""
+    institution_keys = get_row_institution_keys(df)
+    return len(np.unique(institution_keys[institution_keys >= 0]))
+
 
 class ShisetsuKijunFilingStatusDataFrame(pd.DataFrame):
     """Custom DataFrame class for facility criteria filing status aggregation"""
@@ -23,22 +46,19 @@ class ShisetsuKijunFilingStatusDataFrame(pd.DataFrame):
         if not isinstance(df, ShisetsuKijunDataFrame):
             df = ShisetsuKijunDataFrame(df)
         
-        # Get total number of institutions in filtered data (by institution number)
-        total_institutions = df['医療機関番号'].nunique()
+        # Get total number of institutions in filtered data (by institution key)
+        total_institutions = count_institutions(df)
         
         if total_institutions == 0:
             return cls()
         
-        # Calculate filing status counts and institution counts
-        # Group by both 受理届出名称 and 受理記号 (1-to-1 relationship)
+        # Calculate institution counts per filing (distinct institution keys)
+        institution_filings = df[FILING_STATUS_COLUMNS].assign(医療機関キー=get_row_institution_keys(df))
+        institution_filings = institution_filings[institution_filings['医療機関キー'] >= 0]
         filing_status = (
-            df.groupby(['受理届出名称', '受理記号'])
-            .agg({
-                '医療機関番号': 'nunique',  # Number of unique institutions
-            })
-            .rename(columns={
-                '医療機関番号': '届出医療機関数',
-            })
+            institution_filings.groupby(FILING_STATUS_COLUMNS, observed=True)['医療機関キー']
+            .nunique()
+            .rename('届出医療機関数')
             .reset_index()
         )
         
@@ -95,5 +115,5 @@ class ShisetsuKijunFilingStatusDataFrame(pd.DataFrame):
         """
         if not isinstance(source_df, ShisetsuKijunDataFrame):
             source_df = ShisetsuKijunDataFrame(source_df)
-        return source_df['医療機関番号'].nunique()
+        return count_institutions(source_df)
 
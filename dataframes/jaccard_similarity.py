@@ -1,134 +1,354 @@
+import numpy as np
 import pandas as pd
-import ast
-from .shisetsu_kijun import ShisetsuKijunDataFrame
+from .shisetsu_kijun import INSTITUTION_KEY_COLUMNS, ShisetsuKijunDataFrame
+from .filing_incidence import FilingIncidenceMatrix
+from .bed_index import BED_COUNT_COLUMN_PREFIX, BedCountIndex
+
+# Supported similarity metrics (all computed from intersection sizes over the incidence matrix)
+SIMILARITY_METRICS = ['jaccard', 'idf_jaccard', 'cosine', 'overlap', 'dice']
 
 
 class JaccardSimilarityDataFrame(pd.DataFrame):
-    """Custom DataFrame class for Jaccard similarity results"""
+    """Custom DataFrame class for Jaccard similarity results
+    
+    類似度 is the Jaccard similarity by default; the other SIMILARITY_METRICS can be
+    selected with the metric argument of from_shisetsu_kijun and top_k_similar.
+    """
     
     @property
     def _constructor(self):
         return JaccardSimilarityDataFrame
     
     @classmethod
-    def _calculate_jaccard_similarity(cls, set1, set2):
-        """Calculate Jaccard similarity coefficient between two sets"""
-        if len(set1) == 0 and len(set2) == 0:
-            return 1.0
-        intersection = len(set1.intersection(set2))
-        union = len(set1.union(set2))
-        return intersection / union if union > 0 else 0.0
-    
-    @classmethod
-    def from_shisetsu_kijun(cls, df, target_institution_name):
+    def from_shisetsu_kijun(cls, df, target_institution_name, incidence=None, metric='jaccard'):
         """Create JaccardSimilarityDataFrame from ShisetsuKijunDataFrame by calculating Jaccard similarity
         
         Args:
             df: ShisetsuKijunDataFrame instance
             target_institution_name: Name of the target institution
+            incidence: Optional FilingIncidenceMatrix built from df (built on the fly if omitted)
+            metric: Similarity metric, one of SIMILARITY_METRICS (default: 'jaccard')
             
         Returns:
             JaccardSimilarityDataFrame with similarity results
         """
-        # Ensure df is ShisetsuKijunDataFrame
-        if not isinstance(df, ShisetsuKijunDataFrame):
-            df = ShisetsuKijunDataFrame(df)
-        
-        # Get target institution's number first
-        target_institution_data = df.filter_by_exact_institution_name(target_institution_name)
-        if len(target_institution_data) == 0:
+        cls._check_metric(metric)
+        incidence, target_row = cls._resolve_target(df, target_institution_name, incidence)
+        if target_row is None:
             return cls()
         
-        target_institution_number = target_institution_data.iloc[0]['医療機関番号']
+        # Intersection sizes from the posting lists of the target's filings
+        intersections, weighted_intersections = cls._count_overlaps(incidence, target_row, metric)
+        
+        # Only institutions sharing at least one filing can have a non-zero similarity
+        candidate_mask = intersections > 0
+        candidate_mask[target_row] = False
+        rows = np.flatnonzero(candidate_mask)
         
-        # Pre-group all institutions' filings by institution number (more accurate than name)
-        institution_filings_dict = (
-            df.groupby('医療機関番号')['受理届出名称']
-            .apply(lambda x: set(x.dropna().unique()))
-            .to_dict()
+        similarities = cls._score_similarity(
+            metric, incidence, target_row, rows, intersections[rows],
+            weighted_intersections[rows] if weighted_intersections is not None else None
+        )
+        return cls.from_similarity_results(
+            cls._build_similarity_data(incidence, rows, intersections[rows], incidence.row_sizes[target_row], similarities)
         )
+    
+    @classmethod
+    def from_neighbours(cls, df, target_institution_name, neighbours, incidence=None):
+        """Create JaccardSimilarityDataFrame from a precomputed nearest-neighbour table
+        
+        The table keeps the top_n most similar institutions of every institution
+        (neighbours.attrs['top_n']), so this is a top-N view like top_k_similar with
+        k=top_n: institutions ranked lower are not included (see from_shisetsu_kijun).
+        
+        Args:
+            df: ShisetsuKijunDataFrame instance
+            target_institution_name: Name of the target institution
+            neighbours: Neighbour table written by create_neighbours.py (sorted by 都道府県コード and 医療機関番号)
+            incidence: Optional FilingIncidenceMatrix built from df (built on the fly if omitted)
+            
+        Returns:
+            JaccardSimilarityDataFrame with the target's neighbours
+        """
+        incidence, target_row = cls._resolve_target(df, target_institution_name, incidence)
+        if target_row is None:
+            return cls()
+        
+        # The target's neighbours are one contiguous block of the sorted table
+        # (binary search one key column at a time, so the table's keys are not packed on every lookup)
+        start, end = 0, len(neighbours)
+        target_key = (incidence.prefecture_codes[target_row], incidence.institution_numbers[target_row])
+        for col, value in zip(INSTITUTION_KEY_COLUMNS, target_key, strict=True):
+            values = neighbours[col].to_numpy()[start:end]
+            start, end = start + np.searchsorted(values, value, side='left'), start + np.searchsorted(values, value, side='right')
+        block = neighbours.iloc[start:end]
         
-        # Get institution name mapping (number -> name)
-        institution_name_mapping = (
-            df.groupby('医療機関番号')['医療機関名称']
-            .first()
-            .to_dict()
+        # Skip neighbours missing from the current dataset
+        rows = incidence.get_rows(block['類似都道府県コード'], block['類似医療機関番号'])
+        found = rows >= 0
+        
+        return cls.from_similarity_results(
+            cls._build_similarity_data(
+                incidence, rows[found], block['重複届出数'].to_numpy(dtype=np.int64)[found], incidence.row_sizes[target_row]
+            )
         )
+    
+    @classmethod
+    def top_k_similar(cls, df, target_institution_name, k=20, incidence=None, candidate_institutions=None, metric='jaccard'):
+        """Get the k institutions most similar to the target without ranking every institution
         
-        # Get bed counts for each institution using drop_duplicates
-        unique_institutions = df[['医療機関番号', '病床数']].drop_duplicates(subset='医療機関番号', keep='first')
+        Jaccard similarity is bounded by the set sizes: J(A, B) <= min(|A|, |B|) / max(|A|, |B|)
+        (see _similarity_upper_bound for the other metrics).
+        Candidates are scored in buckets of equal filing count, most promising bucket first,
+        and the search stops once the k-th best score reaches the bound of the remaining buckets.
         
-        # Convert to dict, handling string to dict conversion
-        institution_bed_counts = {}
-        for _, row in unique_institutions.iterrows():
-            inst_num = row['医療機関番号']
-            bed_count = row['病床数']
+        Args:
+            df: ShisetsuKijunDataFrame instance
+            target_institution_name: Name of the target institution
+            k: Number of similar institutions to return
+            incidence: Optional FilingIncidenceMatrix built from df (built on the fly if omitted)
+            candidate_institutions: Optional DataFrame with 都道府県コード and 医療機関番号 columns
+                (e.g. a filtered ShisetsuKijunDataFrame) to restrict the candidates to
+            metric: Similarity metric, one of SIMILARITY_METRICS (default: 'jaccard')
             
-            # If it's a string (JSON-like), convert to dict
-            if isinstance(bed_count, str):
-                try:
-                    institution_bed_counts[inst_num] = ast.literal_eval(bed_count)
-                except:
-                    institution_bed_counts[inst_num] = {}
-            # If already a dict, use as is
-            elif isinstance(bed_count, dict):
-                institution_bed_counts[inst_num] = bed_count
-            else:
-                institution_bed_counts[inst_num] = {}
-        
-        # Get target institution's filings
-        target_filings = institution_filings_dict.get(target_institution_number, set())
-        
-        if len(target_filings) == 0:
+        Returns:
+            JaccardSimilarityDataFrame with at most k rows, sorted by 類似度 descending
+        """
+        cls._check_metric(metric)
+        incidence, target_row = cls._resolve_target(df, target_institution_name, incidence)
+        if target_row is None or k <= 0:
             return cls()
         
-        # Calculate similarities for all other institutions
-        similarities = []
-        for institution_number, filings in institution_filings_dict.items():
-            if institution_number == target_institution_number or len(filings) == 0:
-                continue
+        target_size = int(incidence.row_sizes[target_row])
+        overlaps, weighted_overlaps = cls._count_overlaps(incidence, target_row, metric)
+        
+        # Institutions sharing no filing with the target can't make the cut
+        candidate_mask = overlaps > 0
+        if candidate_institutions is not None:
+            allowed = np.zeros(incidence.n_institutions, dtype=bool)
+            rows = incidence.get_rows(candidate_institutions['都道府県コード'], candidate_institutions['医療機関番号'])
+            allowed[rows[rows >= 0]] = True
+            candidate_mask &= allowed
+        candidate_mask[target_row] = False
+        candidate_rows = np.flatnonzero(candidate_mask)
+        
+        # Bucket candidates by filing count; the upper bound only depends on the count
+        candidate_sizes = incidence.row_sizes[candidate_rows]
+        bucket_sizes, bucket_ids = np.unique(candidate_sizes, return_inverse=True)
+        bucket_bounds = cls._similarity_upper_bound(metric, target_size, bucket_sizes)
+        bucket_order = np.argsort(-bucket_bounds, kind='stable')
+        candidate_order = np.argsort(bucket_ids, kind='stable')
+        bucket_starts = np.searchsorted(bucket_ids[candidate_order], np.arange(len(bucket_sizes)))
+        bucket_ends = np.append(bucket_starts[1:], len(candidate_order))
+        
+        best_rows = np.empty(0, dtype=np.int64)
+        best_intersections = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0)
+        for bucket in bucket_order:
+            # Stop when no remaining candidate can beat the current k-th best score
+            if len(best_scores) == k and best_scores.min() >= bucket_bounds[bucket]:
+                break
+            
+            rows = candidate_rows[candidate_order[bucket_starts[bucket]:bucket_ends[bucket]]]
+            intersections = overlaps[rows]
+            scores = cls._score_similarity(
+                metric, incidence, target_row, rows, intersections,
+                weighted_overlaps[rows] if weighted_overlaps is not None else None
+            )
             
-            similarity = cls._calculate_jaccard_similarity(target_filings, filings)
-            overlap = target_filings.intersection(filings)
-            unique_to_target = target_filings - filings
-            unique_to_institution = filings - target_filings
+            # Keep only the k best seen so far (partial selection, no full sort)
+            best_rows = np.concatenate([best_rows, rows])
+            best_intersections = np.concatenate([best_intersections, intersections])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows = best_rows[keep]
+                best_intersections = best_intersections[keep]
+                best_scores = best_scores[keep]
+        
+        return cls.from_similarity_results(
+            cls._build_similarity_data(incidence, best_rows, best_intersections, target_size, best_scores)
+        )
+    
+    @classmethod
+    def _check_metric(cls, metric):
+        """Raise ValueError for an unsupported similarity metric"""
+        if metric not in SIMILARITY_METRICS:
+            raise ValueError(f"Unknown similarity metric: {metric} (expected one of {SIMILARITY_METRICS})")
+    
+    @classmethod
+    def _count_overlaps(cls, incidence, target_row, metric):
+        """Count filings shared with the target for every institution
+        
+        Args:
+            incidence: FilingIncidenceMatrix
+            target_row: Row position of the target institution
+            metric: Similarity metric
             
-            # Get bed count from our mapping (should already be a dict)
-            bed_count = institution_bed_counts.get(institution_number, {})
+        Returns:
+            Tuple of (intersection sizes, IDF-weighted intersections or None), one element per row
+        """
+        target_filing_ids = incidence.get_row_filing_ids(target_row)
+        intersections = incidence.count_overlaps(target_filing_ids)
+        weighted_intersections = None
+        if metric == 'idf_jaccard':
+            weights, _ = incidence.get_idf_weights()
+            weighted_intersections = incidence.count_overlaps(target_filing_ids, weights[target_filing_ids])
+        return intersections, weighted_intersections
+    
+    @classmethod
+    def _score_similarity(cls, metric, incidence, target_row, rows, intersections, weighted_intersections=None):
+        """Compute similarity scores from intersection sizes
+        
+        With a = |A|, b = |B| and i = |A ∩ B|:
+        jaccard i / (a + b - i), cosine i / sqrt(a b), overlap i / min(a, b), dice 2 i / (a + b).
+        idf_jaccard is the Jaccard similarity with every filing type weighted by its IDF.
+        
+        Args:
+            metric: Similarity metric
+            incidence: FilingIncidenceMatrix
+            target_row: Row position of the target institution
+            rows: Row positions of the compared institutions
+            intersections: Intersection sizes with the target for each row
+            weighted_intersections: IDF-weighted intersections for each row (idf_jaccard only)
             
-            # Ensure it's a dict and make a copy
-            if not isinstance(bed_count, dict):
-                bed_count = {}
-            else:
-                bed_count = dict(bed_count)
+        Returns:
+            Float array of similarity scores
+        """
+        target_size = incidence.row_sizes[target_row]
+        sizes = incidence.row_sizes[rows]
+        
+        if metric == 'jaccard':
+            return intersections / (target_size + sizes - intersections)
+        if metric == 'idf_jaccard':
+            _, weighted_sizes = incidence.get_idf_weights()
+            unions = weighted_sizes[target_row] + weighted_sizes[rows] - weighted_intersections
+            # Filings held by every institution weigh 0, so the union can be empty
+            return np.divide(weighted_intersections, unions, out=np.zeros(len(rows)), where=unions > 0)
+        if metric == 'cosine':
+            return intersections / np.sqrt(target_size * sizes)
+        if metric == 'overlap':
+            return intersections / np.minimum(target_size, sizes)
+        return 2 * intersections / (target_size + sizes)
+    
+    @classmethod
+    def _similarity_upper_bound(cls, metric, target_size, sizes):
+        """Upper bound of the similarity with institutions of the given filing counts
+        
+        Args:
+            metric: Similarity metric
+            target_size: Number of filing types of the target institution
+            sizes: Array of filing counts
             
-            # Extract bed types from bed count dict (keys are bed types)
-            bed_types = []
-            if bed_count:
-                bed_types = [str(k).strip() for k in bed_count.keys() if k is not None and str(k).strip()]
-                bed_types = sorted([bt for bt in bed_types if bt])  # Remove empty strings and sort
+        Returns:
+            Float array of upper bounds (1 where the metric has no size-based bound)
+        """
+        ratios = np.minimum(sizes, target_size) / np.maximum(sizes, target_size)
+        if metric == 'jaccard':
+            return ratios
+        if metric == 'cosine':
+            return np.sqrt(ratios)
+        if metric == 'dice':
+            return 2 * ratios / (1 + ratios)
+        return np.ones(len(sizes))
+    
+    @classmethod
+    def _resolve_target(cls, df, target_institution_name, incidence):
+        """Find the incidence row of the target institution
+        
+        Args:
+            df: ShisetsuKijunDataFrame instance
+            target_institution_name: Name of the target institution
+            incidence: Optional FilingIncidenceMatrix built from df (built on the fly if omitted)
             
-            # Get institution name
-            institution_name = institution_name_mapping.get(institution_number, f"医療機関番号: {institution_number}")
+        Returns:
+            Tuple of (incidence, target row), the row being None if the target has no filings
+        """
+        # Ensure df is ShisetsuKijunDataFrame
+        if not isinstance(df, ShisetsuKijunDataFrame):
+            df = ShisetsuKijunDataFrame(df)
+        
+        # Get target institution's key (都道府県コード, 医療機関番号) first
+        target_institution_data = df.filter_by_exact_institution_name(target_institution_name)
+        if len(target_institution_data) == 0:
+            return incidence, None
+        
+        target_prefecture_code = target_institution_data['都道府県コード'].iloc[0]
+        target_institution_number = target_institution_data['医療機関番号'].iloc[0]
+        
+        # Per-institution filings, names and bed counts come from the shared incidence matrix
+        if incidence is None:
+            incidence = FilingIncidenceMatrix.from_shisetsu_kijun(df)
+        target_row = incidence.get_row(target_prefecture_code, target_institution_number)
+        if target_row is None or incidence.row_sizes[target_row] == 0:
+            return incidence, None
+        return incidence, target_row
+    
+    @classmethod
+    def _build_similarity_data(cls, incidence, rows, intersections, target_size, similarities=None):
+        """Build similarity result columns from intersection sizes
+        
+        Union and the 対象機関のみ/類似機関のみ counts follow from the precomputed row cardinalities:
+        |A ∪ B| = |A| + |B| - |A ∩ B|, |A - B| = |A| - |A ∩ B|, |B - A| = |B| - |A ∩ B|
+        
+        Args:
+            incidence: FilingIncidenceMatrix
+            rows: Row positions of the compared institutions
+            intersections: Intersection sizes with the target for each row
+            target_size: Number of filing types of the target institution
+            similarities: Optional similarity scores for each row (Jaccard similarity if omitted)
             
-            similarities.append({
-                '医療機関名称': institution_name,
-                '病床種類': bed_types,
-                '病床数': bed_count,
-                '類似度': similarity,
-                '重複届出数': len(overlap),
-                '対象機関のみの届出数': len(unique_to_target),
-                '類似機関のみの届出数': len(unique_to_institution),
-            })
-        
-        return cls.from_similarity_results(similarities)
+        Returns:
+            Dict of result columns (empty dict if there are no rows)
+        """
+        if len(rows) == 0:
+            return {}
+        
+        sizes = incidence.row_sizes[rows]
+        unions = target_size + sizes - intersections
+        
+        # Get institution names (fall back to the number if the name is missing)
+        institution_names = [
+            name if isinstance(name, str) else f"医療機関番号: {number}"
+            for name, number in zip(incidence.institution_names[rows], incidence.institution_numbers[rows], strict=True)
+        ]
+        
+        # Copy bed count dicts; bed types (their keys) are precomputed per institution
+        bed_counts = [dict(bed_count) if isinstance(bed_count, dict) else {} for bed_count in incidence.bed_counts[rows]]
+        all_bed_types = incidence.get_bed_types()
+        bed_types = [list(all_bed_types[row]) for row in rows.tolist()]
+        
+        similarity_data = {
+            '都道府県コード': incidence.prefecture_codes[rows],
+            '医療機関番号': incidence.institution_numbers[rows],
+            '医療機関名称': institution_names,
+            '病床種類': bed_types,
+            '病床数': bed_counts,
+            '類似度': similarities if similarities is not None else intersections / unions,
+            '重複届出数': intersections,
+            '対象機関のみの届出数': target_size - intersections,
+            '類似機関のみの届出数': sizes - intersections,
+        }
+        
+        # Typed bed count columns from the precomputed bed index, so the bed filters need no dict scan
+        # (skipped if some count is not numeric, which only the 病床数 dicts can represent)
+        bed_index = incidence.get_bed_index()
+        if not bed_index.has_invalid_counts():
+            counts = bed_index.counts[rows]
+            missing = np.isnan(counts)
+            values = np.where(missing, 0, counts).astype(np.int32)
+            for j, bed_type in enumerate(bed_index.bed_types):
+                column = BED_COUNT_COLUMN_PREFIX + ('' if bed_type is None else str(bed_type))
+                similarity_data[column] = pd.arrays.IntegerArray(values[:, j], missing[:, j])
+        
+        return similarity_data
     
     @classmethod
     def from_similarity_results(cls, similarity_data):
         """Create JaccardSimilarityDataFrame from similarity results
         
         Args:
-            similarity_data: List of dictionaries with similarity data
+            similarity_data: List of dictionaries or dict of columns with similarity data
             
         Returns:
             JaccardSimilarityDataFrame instance
@@ -149,17 +369,9 @@ class JaccardSimilarityDataFrame(pd.DataFrame):
     
     def get_all_bed_types(self):
         """Get all available bed types from the dataframe"""
-        all_bed_types = set()
         if '病床種類' not in self.columns:
             return []
-        
-        for bed_types_list in self['病床種類']:
-            if isinstance(bed_types_list, list):
-                # Filter out None values and empty strings, and strip whitespace
-                cleaned_types = [str(bt).strip() for bt in bed_types_list if bt is not None and str(bt).strip()]
-                all_bed_types.update(cleaned_types)
-        
-        return sorted([bt for bt in all_bed_types if bt])  # Remove empty strings
+        return BedCountIndex.from_frame(self).get_all_bed_types()
     
     def filter_by_bed_types(self, selected_bed_types):
         """Filter dataframe by selected bed types
@@ -177,9 +389,7 @@ class JaccardSimilarityDataFrame(pd.DataFrame):
             return self.copy()
         
         # Filter institutions that have at least one of the selected bed types
-        mask = self['病床種類'].apply(
-            lambda x: bool(set(x).intersection(set(selected_bed_types))) if isinstance(x, list) else False
-        )
+        mask = BedCountIndex.from_frame(self).has_any_bed_type(selected_bed_types)
         return self[mask].copy()
     
     def get_bed_count_max(self, selected_bed_types):
@@ -191,11 +401,12 @@ class JaccardSimilarityDataFrame(pd.DataFrame):
         Returns:
             Dict mapping bed type to max bed count
         """
-        # Lazy import to avoid circular dependency
-        from .shisetsu_kijun import ShisetsuKijunDataFrame
-        # Convert to ShisetsuKijunDataFrame for bed count operations
-        temp_df = ShisetsuKijunDataFrame(self[['医療機関名称', '病床数']])
-        return temp_df.get_bed_count_max(selected_bed_types, unique_by='医療機関名称')
+        if not selected_bed_types:
+            return {}
+        
+        # First row of each institution name
+        rows = np.flatnonzero(~self['医療機関名称'].duplicated(keep='first').to_numpy())
+        return BedCountIndex.from_frame(self).get_bed_count_max(selected_bed_types, rows)
     
     def filter_by_bed_counts_generic(self, bed_count_filters):
         """Filter dataframe by bed count ranges
@@ -209,13 +420,8 @@ class JaccardSimilarityDataFrame(pd.DataFrame):
         if not bed_count_filters:
             return self.copy()
         
-        # Lazy import to avoid circular dependency
-        from .shisetsu_kijun import ShisetsuKijunDataFrame
-        # Convert to ShisetsuKijunDataFrame for filtering
-        temp_df = ShisetsuKijunDataFrame(self[['医療機関名称', '病床数']])
-        filtered_temp_df = temp_df.filter_by_bed_counts_generic(bed_count_filters, unique_by='医療機関名称')
-        
-        # Get the filtered institution names and filter the original DataFrame
-        filtered_institution_names = set(filtered_temp_df['医療機関名称'].unique())
+        # Judge each institution name by its first row
+        rows = np.flatnonzero(~self['医療機関名称'].duplicated(keep='first').to_numpy())
+        passes = BedCountIndex.from_frame(self).in_bed_count_ranges(bed_count_filters, rows)
+        filtered_institution_names = set(self['医療機関名称'].iloc[rows[passes]])
         return self[self['医療機関名称'].isin(filtered_institution_names)].copy()
-
@@ -0,0 +1,118 @@
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Katakana (ァ..ヶ) to hiragana (ぁ..ゖ); NFKC has already turned half-width katakana into full-width
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+
+# Gram sizes of the postings; longer queries are answered by intersecting their bigrams
+GRAM_SIZES = (1, 2)
+
+
+def normalize_name(name):
+    """Normalize a name for search
+    
+    NFKC folds full-width/half-width forms, then the name is lowercased, katakana
+    becomes hiragana and whitespace (including full-width spaces) is removed.
+    
+    Example: "ｲﾘｮｳﾎｳｼﾞﾝ　ＡＢＣ病院" -> "いりょうほうじんabc病院"
+    
+    Args:
+        name: Name string (non-strings normalize to an empty string)
+    
+    Returns:
+        Normalized name string
+    """
+    if not isinstance(name, str):
+        return ''
+    name = unicodedata.normalize('NFKC', name).lower().translate(KATAKANA_TO_HIRAGANA)
+    return ''.join(name.split())
+
+
+class InstitutionNameIndex:
+    """N-gram index over 医療機関名称 for substring search
+    
+    Every normalized name is split into character unigrams and bigrams; each gram maps
+    to the sorted row positions of the names containing it. A query gathers its
+    rarest grams' posting lists, intersects them, and checks the few remaining
+    candidates for the whole normalized query, so latency depends on the size of
+    the posting lists rather than on the number of names.
+    """
+    
+    def __init__(self, names):
+        """Build index from institution names
+        
+        Args:
+            names: Sequence of 医療機関名称 (row positions are positions in this sequence)
+        """
+        self.normalized_names = [normalize_name(name) for name in names]
+        self.name_lengths = np.array([len(name) for name in self.normalized_names], dtype=np.int32)
+        
+        # (gram, row) pairs with each gram counted once per name
+        grams = []
+        rows = []
+        for row, name in enumerate(self.normalized_names):
+            name_grams = {name[i:i + n] for n in GRAM_SIZES for i in range(len(name) - n + 1)}
+            grams.extend(name_grams)
+            rows.extend([row] * len(name_grams))
+        rows = np.array(rows, dtype=np.int32)
+        
+        codes, uniques = pd.factorize(pd.Series(grams, dtype=object))
+        order = np.lexsort((rows, codes))
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        sorted_rows = rows[order]
+        self.postings = {
+            gram: sorted_rows[start:end]
+            for gram, start, end in zip(uniques.tolist(), bounds[:-1].tolist(), bounds[1:].tolist(), strict=True)
+        }
+    
+    @classmethod
+    def from_shisetsu_kijun(cls, df):
+        """Build index from the 医療機関名称 column of a ShisetsuKijunDataFrame"""
+        return cls(df['医療機関名称'].tolist())
+    
+    def __len__(self):
+        return len(self.normalized_names)
+    
+    def _get_candidates(self, query):
+        """Intersect the posting lists of the query grams (query is already normalized)"""
+        n = min(len(query), max(GRAM_SIZES))
+        grams = {query[i:i + n] for i in range(len(query) - n + 1)}
+        empty = np.empty(0, dtype=np.int32)
+        postings = sorted((self.postings.get(gram, empty) for gram in grams), key=len)
+        
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        return candidates
+    
+    def search(self, query):
+        """Find names containing the query after normalization
+        
+        Results are ranked: exact matches first, then prefix matches, then by position
+        of the match, then shorter names, then row position.
+        
+        Args:
+            query: Search string
+        
+        Returns:
+            Array of matching row positions in rank order (all rows if the query is empty)
+        """
+        query = normalize_name(query)
+        if not query:
+            return np.arange(len(self), dtype=np.int64)
+        
+        # Gram intersection can produce false positives for queries longer than a bigram
+        candidates = self._get_candidates(query)
+        positions = np.array([self.normalized_names[row].find(query) for row in candidates.tolist()], dtype=np.int64)
+        matched = positions >= 0
+        rows = candidates[matched].astype(np.int64)
+        positions = positions[matched]
+        
+        lengths = self.name_lengths[rows]
+        exact = lengths == len(query)
+        order = np.lexsort((rows, lengths, positions, ~exact))
+        return rows[order]
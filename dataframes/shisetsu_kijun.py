@@ -1,5 +1,27 @@
+import numpy as np
 import pandas as pd
 import ast
+from pathlib import Path
+from .bed_index import BED_COUNT_COLUMN_PREFIX, BedCountIndex
+
+# Normalized dataset layout (see create_feather.build_normalized_tables)
+# 医療機関番号 is only unique within a prefecture
+INSTITUTION_KEY_COLUMNS = ['都道府県コード', '医療機関番号']
+FILING_TYPE_COLUMNS = ['受理届出名称', '受理記号']
+# Columns describing a filing; all other columns describe the institution
+FILING_COLUMNS = ['受理番号', '受理届出名称', '受理記号', '算定開始年月日', '個別有効開始年月日', '算定開始年月日_date']
+
+# Repeated string columns loaded as categoricals in compact mode
+CATEGORICAL_COLUMNS = ['都道府県名', '種別', '受理届出名称', '受理記号', '医療機関名称']
+
+
+def get_companion_file_path(file_path, name):
+    """Get path of a file stored next to a feather file
+    
+    Example: ("data/2025/10/all.feather", "remarks") -> data/2025/10/all_remarks.feather
+    """
+    file_path = Path(file_path)
+    return file_path.with_name(f"{file_path.stem}_{name}{file_path.suffix}")
 
 
 class ShisetsuKijunDataFrame(pd.DataFrame):
@@ -9,13 +31,46 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
     def _constructor(self):
         return ShisetsuKijunDataFrame
     
+    def __setitem__(self, key, value):
+        # Typed bed count columns no longer describe the rows once 病床数 is replaced
+        if isinstance(key, str) and key == '病床数':
+            bed_count_columns = [col for col in self.columns if str(col).startswith(BED_COUNT_COLUMN_PREFIX)]
+            if bed_count_columns:
+                self.drop(columns=bed_count_columns, inplace=True)
+        super().__setitem__(key, value)
+        self._invalidate_bed_index()
+    
+    def _update_inplace(self, result, verify_is_copy=True):
+        # In-place methods (sort_values, drop, ...) replace the rows
+        super()._update_inplace(result, verify_is_copy=verify_is_copy)
+        self._invalidate_bed_index()
+    
+    def _clear_item_cache(self):
+        # pandas calls this after in-place .loc/.iloc assignments
+        super()._clear_item_cache()
+        self._invalidate_bed_index()
+    
+    def _invalidate_bed_index(self):
+        """Drop the cached bed index (see get_bed_index)"""
+        self.__dict__.pop('_bed_index', None)
+    
     @classmethod
-    def from_feather(cls, file_path):
-        """Load data from feather file and return ShisetsuKijunDataFrame instance"""
+    def from_feather(cls, file_path, compact=False):
+        """Load data from feather file and return ShisetsuKijunDataFrame instance
+        
+        Args:
+            file_path: Path of the feather file
+            compact: Load repeated string columns (CATEGORICAL_COLUMNS) as categoricals
+                to reduce memory and speed up groupby/isin/equality filters (default: False)
+        """
         df = pd.read_feather(file_path)
-        # Clean up bed count dicts: remove keys with None values
-        # pandas feather format merges all dict keys across rows, adding None for missing keys
-        if '病床数' in df.columns:
+        bed_count_columns = [col for col in df.columns if str(col).startswith(BED_COUNT_COLUMN_PREFIX)]
+        if '病床数' not in df.columns and bed_count_columns:
+            # Typed columnar layout: rebuild 病床数 dicts from one nullable int column per bed type
+            df.insert(df.columns.get_loc(bed_count_columns[0]), '病床数', cls._bed_count_dicts_from_columns(df[bed_count_columns]))
+        elif '病床数' in df.columns:
+            # Legacy layout: clean up bed count dicts, removing keys with None values
+            # pandas feather format merges all dict keys across rows, adding None for missing keys
             def clean_bed_dict(bed_count):
                 # Convert string representation to dict if needed
                 if isinstance(bed_count, str):
@@ -39,16 +94,125 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
                 return bed_count
             df['病床数'] = df['病床数'].apply(clean_bed_dict)
         
+        if compact:
+            df = cls._to_compact(df)
+        
+        return cls(df)
+    
+    @classmethod
+    def from_normalized(cls, file_path, compact=False):
+        """Load normalized dataset and return ShisetsuKijunDataFrame instance
+        
+        Reads the institutions, filing types and filings tables written next to
+        file_path by create_feather.py and joins them back into one row per filing.
+        
+        Args:
+            file_path: Path of the flat feather file (e.g. data/2025/10/all.feather)
+            compact: Load repeated string columns (CATEGORICAL_COLUMNS) as categoricals (default: False)
+            
+        Returns:
+            ShisetsuKijunDataFrame with the same columns as from_feather
+        """
+        institutions = pd.read_feather(get_companion_file_path(file_path, 'institutions'))
+        filing_types = pd.read_feather(get_companion_file_path(file_path, 'filing_types'))
+        filings = pd.read_feather(get_companion_file_path(file_path, 'filings'))
+        
+        # Build bed count dicts once per institution instead of once per filing
+        bed_count_columns = [col for col in institutions.columns if str(col).startswith(BED_COUNT_COLUMN_PREFIX)]
+        if bed_count_columns:
+            bed_count_dicts = np.empty(len(institutions), dtype=object)
+            bed_count_dicts[:] = cls._bed_count_dicts_from_columns(institutions[bed_count_columns])
+            institutions.insert(institutions.columns.get_loc(bed_count_columns[0]), '病床数', bed_count_dicts)
+        
+        if compact:
+            # Convert the small dimension tables; take() below keeps the categorical dtype
+            institutions = cls._to_compact(institutions)
+            filing_types = cls._to_compact(filing_types)
+        
+        # IDs are row positions in the dimension tables
+        institution_rows = institutions.drop(columns='医療機関ID').take(filings['医療機関ID'].to_numpy())
+        filing_type_rows = filing_types.drop(columns='届出ID').take(filings['届出ID'].to_numpy())
+        filing_rows = filings.drop(columns=['医療機関ID', '届出ID'])
+        for col in filing_rows.columns:
+            if isinstance(filing_rows[col].dtype, pd.CategoricalDtype):
+                filing_rows[col] = filing_rows[col].astype(object)
+        
+        df = pd.concat([
+            institution_rows.reset_index(drop=True),
+            filing_type_rows.reset_index(drop=True),
+            filing_rows.reset_index(drop=True),
+        ], axis=1)
+        
+        return cls(df)
+    
+    @classmethod
+    def from_institution_summary(cls, file_path):
+        """Load institution summary written next to file_path by create_feather.py
+        
+        Args:
+            file_path: Path of the flat feather file (e.g. data/2025/10/all.feather)
+            
+        Returns:
+            ShisetsuKijunDataFrame with one row per institution (都道府県コード and 医療機関番号),
+            sorted by 医療機関名称, including filing count (届出数)
+        """
+        df = pd.read_feather(get_companion_file_path(file_path, 'institution_summary'))
+        bed_count_columns = [col for col in df.columns if str(col).startswith(BED_COUNT_COLUMN_PREFIX)]
+        if bed_count_columns:
+            df.insert(df.columns.get_loc(bed_count_columns[0]), '病床数', cls._bed_count_dicts_from_columns(df[bed_count_columns]))
         return cls(df)
     
+    @classmethod
+    def _to_compact(cls, df):
+        """Convert repeated string columns (CATEGORICAL_COLUMNS) to categoricals"""
+        columns = [col for col in CATEGORICAL_COLUMNS if col in df.columns]
+        return df.astype(dict.fromkeys(columns, 'category'))
+    
+    @classmethod
+    def _bed_count_dicts_from_columns(cls, bed_counts):
+        """Build 病床数 dicts from typed bed count columns
+        
+        Rows repeat the same few thousand bed count combinations, so each distinct
+        combination is converted once and shared by all rows that have it.
+        
+        Args:
+            bed_counts: DataFrame of nullable int columns named BED_COUNT_COLUMN_PREFIX + bed type
+            
+        Returns:
+            List of dicts mapping bed type to bed count (None key for counts without a type)
+        """
+        if len(bed_counts) == 0:
+            return []
+        
+        bed_types = [col[len(BED_COUNT_COLUMN_PREFIX):] or None for col in bed_counts.columns]
+        codes = bed_counts.groupby(list(bed_counts.columns), dropna=False, sort=False).ngroup().to_numpy()
+        _, first_positions, inverse = np.unique(codes, return_index=True, return_inverse=True)
+        
+        distinct_dicts = [
+            {bed_type: int(value) for bed_type, value in zip(bed_types, row, strict=True) if not pd.isna(value)}
+            for row in bed_counts.iloc[first_positions].itertuples(index=False, name=None)
+        ]
+        return [distinct_dicts[i] for i in inverse]
+    
+    def get_bed_index(self):
+        """Get bed type and bed count index of the rows
+        
+        The index is built on first use and kept with this dataframe; frames derived by
+        filtering get their own. Assignments and in-place methods drop it, so it is rebuilt
+        after the rows or the bed columns change.
+        
+        Returns:
+            BedCountIndex aligned with the rows
+        """
+        bed_index = self.__dict__.get('_bed_index')
+        if bed_index is None or len(bed_index) != len(self):
+            bed_index = BedCountIndex.from_frame(self)
+            object.__setattr__(self, '_bed_index', bed_index)
+        return bed_index
+    
     def get_all_bed_types(self):
         """Get all available bed types from the dataframe"""
-        all_bed_types = set()
-        for bed_count in self['病床数']:
-            if isinstance(bed_count, dict):
-                bed_types = [str(k).strip() for k in bed_count.keys() if k is not None and str(k).strip()]
-                all_bed_types.update(bed_types)
-        return sorted([bt for bt in all_bed_types if bt])
+        return self.get_bed_index().get_all_bed_types()
     
     def filter_by_bed_types(self, selected_bed_types):
         """Filter dataframe by selected bed types
@@ -62,27 +226,9 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         if not selected_bed_types:
             return self.copy()
         
-        # Get institutions (by institution number) that have selected bed types
-        def aggregate_bed_types(group):
-            """Aggregate all bed types from all records of an institution"""
-            all_bed_types = set()
-            for bed_count in group:
-                if isinstance(bed_count, dict):
-                    bed_types = [str(k).strip() for k in bed_count.keys() if k is not None and str(k).strip()]
-                    all_bed_types.update(bed_types)
-            return all_bed_types
-        
-        institution_bed_types = (
-            self.groupby('医療機関番号')['病床数']
-            .apply(aggregate_bed_types)
-            .to_dict()
-        )
-        
-        # Filter institutions that have at least one of the selected bed types
-        filtered_institution_numbers = {
-            inst_num for inst_num, bed_types in institution_bed_types.items()
-            if set(selected_bed_types).intersection(bed_types)
-        }
+        # Institutions (by institution number) with at least one of the selected bed types in any record
+        has_bed_type = self.get_bed_index().has_any_bed_type(selected_bed_types)
+        filtered_institution_numbers = self['医療機関番号'][has_bed_type].dropna().unique()
         
         # Filter data to only include filtered institutions
         mask = self['医療機関番号'].isin(filtered_institution_numbers)
@@ -97,43 +243,7 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         Returns:
             ShisetsuKijunDataFrame filtered by bed counts
         """
-        if not bed_count_filters:
-            return self.copy()
-        
-        # Get unique institutions with their bed counts
-        unique_institutions = self[['医療機関番号', '病床数']].drop_duplicates(subset='医療機関番号', keep='first')
-        
-        def passes_bed_count_filter(row):
-            """Check if institution passes bed count filters"""
-            bed_count_dict = row['病床数']
-            if not isinstance(bed_count_dict, dict):
-                return True  # Include records without bed count data
-            
-            # Check if ALL selected bed type filters are satisfied (AND condition)
-            for bed_type, (min_val, max_val) in bed_count_filters.items():
-                # If this bed type exists in the institution's bed count
-                if bed_type in bed_count_dict:
-                    bed_num = bed_count_dict[bed_type]
-                    if isinstance(bed_num, (int, float)) and bed_num is not None:
-                        # Check if it's within the range
-                        if not (min_val <= bed_num <= max_val):
-                            return False  # Failed this filter condition
-                    else:
-                        return False  # Invalid bed number
-                else:
-                    # If bed type is not in the institution, include it (True)
-                    continue  # Skip this filter condition and check others
-            
-            # All conditions passed
-            return True
-        
-        # Filter institutions by bed count
-        mask = unique_institutions.apply(passes_bed_count_filter, axis=1)
-        filtered_institution_numbers_by_bed_count = unique_institutions[mask]['医療機関番号'].unique()
-        
-        # Apply the filter to self
-        mask = self['医療機関番号'].isin(filtered_institution_numbers_by_bed_count)
-        return self[mask].copy()
+        return self.filter_by_bed_counts_generic(bed_count_filters)
     
     def get_bed_count_max(self, selected_bed_types, unique_by='医療機関番号'):
         """Get maximum bed count for each selected bed type
@@ -148,37 +258,19 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         if not selected_bed_types:
             return {}
         
-        bed_count_max = {}
-        # Get unique institutions with their bed counts (more efficient)
+        # First record of each unique institution (all records if unique_by column doesn't exist)
+        rows = None
         if unique_by in self.columns:
-            unique_institutions = self[[unique_by, '病床数']].drop_duplicates(subset=unique_by, keep='first')
-        else:
-            # Fallback: use index if unique_by column doesn't exist
-            unique_institutions = self[['病床数']].drop_duplicates()
-        
-        # Collect all bed counts for all selected bed types in a single pass
-        bed_counts_by_type = {bed_type: [] for bed_type in selected_bed_types}
-        
-        # Single loop through unique institutions (direct Series iteration is faster than iterrows)
-        bed_count_series = unique_institutions['病床数']
-        for bed_count_dict in bed_count_series:
-            if isinstance(bed_count_dict, dict):
-                for bed_type in selected_bed_types:
-                    if bed_type in bed_count_dict:
-                        bed_num = bed_count_dict[bed_type]
-                        if isinstance(bed_num, (int, float)) and bed_num is not None:
-                            bed_counts_by_type[bed_type].append(bed_num)
-        
-        # Calculate max for each bed type
-        for bed_type, bed_counts in bed_counts_by_type.items():
-            if bed_counts:
-                bed_count_max[bed_type] = int(max(bed_counts))
-        
-        return bed_count_max
+            rows = np.flatnonzero(~self[unique_by].duplicated(keep='first').to_numpy())
+        return self.get_bed_index().get_bed_count_max(selected_bed_types, rows)
     
     def filter_by_bed_counts_generic(self, bed_count_filters, unique_by='医療機関番号'):
         """Filter dataframe by bed count ranges (generic version that works with any unique column)
         
+        An institution passes if its first record satisfies every range (AND condition);
+        a bed type the institution lacks does not exclude it, and records without bed
+        count data are included.
+        
         Args:
             bed_count_filters: Dict mapping bed type to (min_val, max_val) tuple
             unique_by: Column name to use for unique identification (default: '医療機関番号')
@@ -189,48 +281,16 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         if not bed_count_filters:
             return self.copy()
         
-        # Get unique institutions with their bed counts
+        bed_index = self.get_bed_index()
         if unique_by in self.columns:
-            unique_institutions = self[[unique_by, '病床数']].drop_duplicates(subset=unique_by, keep='first')
+            # Judge each unique institution by its first record
+            rows = np.flatnonzero(~self[unique_by].duplicated(keep='first').to_numpy())
+            passes = bed_index.in_bed_count_ranges(bed_count_filters, rows)
+            mask = self[unique_by].isin(self[unique_by].iloc[rows[passes]].unique())
         else:
-            # Fallback: use index if unique_by column doesn't exist
-            unique_institutions = self[['病床数']].copy()
-            unique_institutions['_index'] = unique_institutions.index
-            unique_by = '_index'
-        
-        def passes_bed_count_filter(row):
-            """Check if institution passes bed count filters"""
-            bed_count_dict = row['病床数']
-            if not isinstance(bed_count_dict, dict):
-                return True  # Include records without bed count data
-            
-            # Check if ALL selected bed type filters are satisfied (AND condition)
-            for bed_type, (min_val, max_val) in bed_count_filters.items():
-                # If this bed type exists in the institution's bed count
-                if bed_type in bed_count_dict:
-                    bed_num = bed_count_dict[bed_type]
-                    if isinstance(bed_num, (int, float)) and bed_num is not None:
-                        # Check if it's within the range
-                        if not (min_val <= bed_num <= max_val):
-                            return False  # Failed this filter condition
-                    else:
-                        return False  # Invalid bed number
-                else:
-                    # If bed type is not in the institution, include it (True)
-                    continue  # Skip this filter condition and check others
-            
-            # All conditions passed
-            return True
-        
-        # Filter institutions by bed count
-        mask = unique_institutions.apply(passes_bed_count_filter, axis=1)
-        filtered_unique_values = unique_institutions[mask][unique_by].unique()
-        
-        # Apply the filter to self
-        if unique_by == '_index':
-            mask = self.index.isin(filtered_unique_values)
-        else:
-            mask = self[unique_by].isin(filtered_unique_values)
+            # Fallback: judge each record and keep its index label
+            passes = bed_index.in_bed_count_ranges(bed_count_filters)
+            mask = self.index.isin(self.index[passes])
         return self[mask].copy()
     
     def filter_by_facility_criteria(self, selected_facility_criteria):
@@ -258,7 +318,7 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         Returns:
             ShisetsuKijunDataFrame with one row per institution, including filing count
         """
-        institutions = self.groupby('医療機関名称').agg({
+        institutions = self.groupby('医療機関名称', observed=True).agg({
             '医療機関番号': 'first',
             '併設医療機関番号': 'first',
             '医療機関記号番号': 'first',
@@ -276,12 +336,15 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         
         return self.__class__(institutions)
     
-    def filter_by_institution_name(self, search_term, case_sensitive=False):
+    def filter_by_institution_name(self, search_term, case_sensitive=False, name_index=None):
         """Filter dataframe by institution name (partial match)
         
         Args:
             search_term: String to search for in institution names
             case_sensitive: Whether the search should be case sensitive (default: False)
+            name_index: Optional InstitutionNameIndex built from this dataframe; matches
+                normalized names (full-width/half-width, katakana/hiragana, case and spaces
+                are ignored) and returns rows ranked by match quality
             
         Returns:
             ShisetsuKijunDataFrame filtered by institution name
@@ -292,6 +355,10 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         if '医療機関名称' not in self.columns:
             return self.copy()
         
+        # Gather the matching rows from the n-gram postings
+        if name_index is not None and not case_sensitive:
+            return self.iloc[name_index.search(search_term)].copy()
+        
         mask = self['医療機関名称'].str.contains(search_term, case=case_sensitive, na=False)
         return self[mask].copy()
     
@@ -313,16 +380,21 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         mask = self['医療機関名称'] == institution_name
         return self[mask].copy()
     
-    def search_institutions_by_filing(self, filing_name, filing_symbol=None):
+    def search_institutions_by_filing(self, filing_name, filing_symbol=None, filing_index=None):
         """Search institutions by filing name or symbol
         
         Args:
             filing_name: Facility criteria name (受理届出名称)
             filing_symbol: Optional facility criteria symbol (受理記号)
+            filing_index: Optional FilingRowIndex built from this dataframe
             
         Returns:
             ShisetsuKijunDataFrame filtered by filing name or symbol
         """
+        # Gather the matching rows from the posting lists
+        if filing_index is not None:
+            return self.__class__(self.iloc[filing_index.get_positions(filing_name, filing_symbol)])
+        
         # Filter by filing name or symbol
         name_mask = self['受理届出名称'] == filing_name
         if filing_symbol:
@@ -343,26 +415,21 @@ class ShisetsuKijunDataFrame(pd.DataFrame):
         
         # Get unique combinations of 受理届出名称 and 受理記号 (1-to-1 relationship)
         filing_options = (
-            self.groupby('受理届出名称')['受理記号']
+            self.groupby('受理届出名称', observed=True)['受理記号']
             .first()
             .reset_index()
         )
         filing_options = filing_options.sort_values('受理届出名称')
         
         # Create options list with display format
-        filing_display_options = []
-        for _, row in filing_options.iterrows():
-            name = row['受理届出名称']
-            symbol = row['受理記号']
-            if pd.notna(symbol) and str(symbol).strip():
-                display_text = f"{name} ({symbol})"
-            else:
-                display_text = name
-            filing_display_options.append({
-                'display': display_text,
+        names = filing_options['受理届出名称'].astype(object).tolist()
+        symbols = filing_options['受理記号'].astype(object).where(filing_options['受理記号'].notna(), '').tolist()
+        return [
+            {
+                'display': f"{name} ({symbol})" if str(symbol).strip() else name,
                 'name': name,
-                'symbol': symbol if pd.notna(symbol) else ''
-            })
-        
-        return filing_display_options
+                'symbol': symbol,
+            }
+            for name, symbol in zip(names, symbols, strict=True)
+        ]
 
@@ -1,7 +1,11 @@
 import streamlit as st
+from utils import format_dataset_month, select_dataset_month
 
 st.title("🏥 医療機関施設基準届出検索システム")
 
+# Dataset month (shared across pages)
+dataset_month = select_dataset_month()
+
 st.markdown("""
 ## システム概要
 このシステムでは、全国の医科医療機関の施設基準届出状況を検索・分析できます。
@@ -14,7 +18,7 @@ st.markdown("""
 - **類似医療機関分析**: 届出内容から類似する医療機関を分析
 
 ### 使用方法
-1. 左側のメニューから目的のページを選択
+1. 左側のメニューから目的のページを選択（データ年月も左側で切り替え可能）
 2. または下のボタンから直接アクセス
 """)
 
@@ -34,5 +38,5 @@ with col3:
         st.switch_page("pages/4_施設基準別届出数.py")
 
 st.markdown("---")
-st.markdown("*データソース: 全国医科医療機関 施設基準届出受理医療機関名簿（2025年10月）*")
+st.markdown(f"*データソース: 全国医科医療機関 施設基準届出受理医療機関名簿（{format_dataset_month(dataset_month)}）*")
 
@@ -1,8 +1,11 @@
 import streamlit as st
-from utils import load_raw_data
+from utils import load_institution_name_completion, load_institution_name_index, load_institution_summary, select_dataset_month
 
 st.title("🏥 医科医療機関検索")
 
+# Dataset month (shared across pages)
+dataset_month = select_dataset_month()
+
 # Maximum number of results to display
 MAX_DISPLAY_RESULTS = 500
 
@@ -11,12 +14,6 @@ DISPLAY_COLUMNS = ['医療機関名称', '医療機関番号', '都道府県名'
                    '医療機関所在地（郵便番号）', '医療機関所在地（住所）', 
                    '電話番号', 'FAX番号', '医療機関記号番号', '種別']
 
-@st.cache_resource
-def load_stats_data():
-    df = load_raw_data()
-    institutions = df.aggregate_by_institution_name()
-    return institutions.sort_values('医療機関名称')
-
 def limit_and_display_results(df, max_results, label_prefix="結果", sort_column=None, ascending=False):
     """Limit results to max_results and display with count message
     
@@ -84,7 +81,7 @@ def display_institutions_table(df, display_columns):
                     st.switch_page("pages/2_特定医療機関の届出状況.py")
 
 # Load data
-institutions = load_stats_data()
+institutions = load_institution_summary()
 st.write(f"総医療機関数: {len(institutions):,} 件")
 
 # Search
@@ -92,7 +89,7 @@ search_term = st.text_input("医療機関名で検索", placeholder="医療機
 
 # Filter results
 if search_term:
-    filtered_institutions = institutions.filter_by_institution_name(search_term)
+    filtered_institutions = institutions.filter_by_institution_name(search_term, name_index=load_institution_name_index())
     
     if len(filtered_institutions) > 0:
         # Limit and display results
@@ -106,6 +103,16 @@ if search_term:
         display_institutions_table(filtered_institutions, DISPLAY_COLUMNS)
     else:
         st.warning("該当する医療機関が見つかりませんでした。")
+        
+        # Suggest close names (typos or variant spellings)
+        suggestions = load_institution_name_completion().complete(search_term, limit=10)
+        if suggestions:
+            st.write("もしかして:")
+            cols = st.columns(min(len(suggestions), 5))
+            for i, suggestion in enumerate(suggestions):
+                if cols[i % len(cols)].button(suggestion, key=f"institution_suggestion_{i}_{suggestion}"):
+                    st.session_state['selected_institution'] = suggestion
+                    st.switch_page("pages/2_特定医療機関の届出状況.py")
 else:
     # Display all institutions when no search term (limited to top MAX_DISPLAY_RESULTS)
     institutions_display = limit_and_display_results(
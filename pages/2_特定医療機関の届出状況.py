@@ -1,8 +1,11 @@
 import streamlit as st
-from utils import load_raw_data, display_institution_basic_info
+from utils import select_dataset_month, load_raw_data, display_institution_basic_info
 
 st.title("📋 特定医療機関の届出状況")
 
+# Dataset month (shared across pages)
+dataset_month = select_dataset_month()
+
 # Get selected institution from session state
 selected_institution = st.session_state.get('selected_institution', None)
 
@@ -1,19 +1,54 @@
 import streamlit as st
 import pandas as pd
 import ast
-from utils import load_raw_data, display_institution_basic_info, format_bed_count
+from utils import select_dataset_month, load_raw_data, load_filing_incidence, load_neighbours, display_institution_basic_info, format_bed_count
 from dataframes import ShisetsuKijunDataFrame, JaccardSimilarityDataFrame, ShisetsuKijunFilingCrossTabDataFrame
 
 st.title("🔍 類似医療機関分析")
 
-@st.cache_resource
-def find_similar_institutions(target_institution, _df):
-    """Find similar institutions based on filing contents"""
+# Dataset month (shared across pages)
+dataset_month = select_dataset_month()
+
+# Display labels of the similarity metrics (see dataframes.jaccard_similarity.SIMILARITY_METRICS)
+SIMILARITY_METRIC_LABELS = {
+    'jaccard': 'Jaccard係数',
+    'idf_jaccard': 'IDF重み付きJaccard係数',
+    'cosine': 'コサイン類似度',
+    'overlap': 'Overlap係数',
+    'dice': 'Dice係数',
+}
+
+# Number of institution columns per page of the cross-tabulation
+CROSS_TAB_PAGE_SIZE = 20
+
+# Number of similar institutions listed unless all of them are requested (without a neighbour table)
+SIMILAR_INSTITUTIONS_TOP_K = 100
+
+# Number of similarity results kept in the cache (a full result holds every institution sharing a filing, ~15MB)
+SIMILAR_INSTITUTIONS_CACHE_ENTRIES = 8
+
+
+@st.cache_resource(max_entries=SIMILAR_INSTITUTIONS_CACHE_ENTRIES)
+def find_similar_institutions(dataset_month, target_institution, _df, _incidence, _neighbours=None, metric='jaccard', show_all=False):
+    """Find similar institutions based on filing contents (cached per dataset month)
+    
+    Only the most similar institutions are listed unless show_all is set: the target's rows of the
+    precomputed neighbour table if available (Jaccard similarity only), else the
+    SIMILAR_INSTITUTIONS_TOP_K best ones.
+    """
     # Convert to ShisetsuKijunDataFrame if not already
     if not isinstance(_df, ShisetsuKijunDataFrame):
         _df = ShisetsuKijunDataFrame(_df)
     
-    return JaccardSimilarityDataFrame.from_shisetsu_kijun(_df, target_institution)
+    if show_all:
+        return JaccardSimilarityDataFrame.from_shisetsu_kijun(_df, target_institution, incidence=_incidence, metric=metric)
+    
+    # Look up the precomputed neighbours if available
+    if _neighbours is not None and metric == 'jaccard':
+        return JaccardSimilarityDataFrame.from_neighbours(_df, target_institution, _neighbours, incidence=_incidence)
+    return JaccardSimilarityDataFrame.top_k_similar(
+        _df, target_institution, k=SIMILAR_INSTITUTIONS_TOP_K, incidence=_incidence, metric=metric
+    )
 
 
 # Get selected institution from session state
@@ -24,6 +59,8 @@ if selected_institution:
     
     # Load data
     df = load_raw_data()
+    incidence = load_filing_incidence()
+    neighbours = load_neighbours()
     
     # Filter data for selected institution
     institution_data = df.filter_by_exact_institution_name(selected_institution)
@@ -37,8 +74,30 @@ if selected_institution:
     # Calculate and display similar institutions
     st.write("### 🔍 類似医療機関分析")
     
+    metric = st.selectbox(
+        "類似度の指標:",
+        options=list(SIMILARITY_METRIC_LABELS.keys()),
+        format_func=lambda m: SIMILARITY_METRIC_LABELS[m],
+        key='similarity_metric',
+        help="IDF重み付きJaccard係数は、多くの医療機関が届け出ている施設基準より珍しい施設基準の一致を重視します"
+    )
+    
+    # Number of listed institutions: the neighbour table's top N, or the top-k search
+    if neighbours is not None and metric == 'jaccard':
+        listed_count = neighbours.attrs.get('top_n', SIMILAR_INSTITUTIONS_TOP_K)
+    else:
+        listed_count = SIMILAR_INSTITUTIONS_TOP_K
+    
+    show_all = st.checkbox(
+        "すべての類似医療機関を計算",
+        value=False,
+        key='similarity_show_all',
+        help=f"オフの場合は類似度上位{listed_count}件だけを表示し、フィルターもその中で適用します。"
+             "オンにすると届出が1件でも共通するすべての医療機関の類似度を計算します"
+    )
+    
     with st.spinner("類似医療機関を計算中..."):
-        similar_df = find_similar_institutions(selected_institution, df)
+        similar_df = find_similar_institutions(dataset_month, selected_institution, df, incidence, neighbours, metric, show_all)
     
     if len(similar_df) > 0:
         # Get target institution's bed types for default filter
@@ -116,7 +175,10 @@ if selected_institution:
             # JaccardSimilarityDataFrame has this method
             filtered_df = filtered_df.filter_by_bed_counts_generic(bed_count_filters)
         
-        st.write(f"**表示件数: {len(filtered_df)}件 (全{len(similar_df)}件中)**")
+        if show_all:
+            st.write(f"**表示件数: {len(filtered_df)}件 (全{len(similar_df)}件中)**")
+        else:
+            st.write(f"**表示件数: {len(filtered_df)}件 (類似度上位{len(similar_df)}件中)**")
         
         # Display detailed table
         display_columns = ['医療機関名称', '病床数', '類似度', '重複届出数', '対象機関のみの届出数', '類似機関のみの届出数']
@@ -133,20 +195,42 @@ if selected_institution:
             hide_index=True
         )
         
-        # Create cross-tabulation table for top 20 similar institutions
-        st.write("### 📊 申請施設基準の届出状況（類似度上位20件）")
+        # Create cross-tabulation table for the peer group (top similar institutions)
+        st.write("### 📊 申請施設基準の届出状況（類似度上位の医療機関）")
         
-        # Get target institution number for optimization (already computed earlier)
-        target_institution_number = row_data['医療機関番号']
+        # Get target institution key for optimization (already computed earlier)
+        target_institution_key = (row_data['都道府県コード'], row_data['医療機関番号'])
         
-        # Get top 20 institutions for cross-tabulation
-        top_20_filtered_df = filtered_df.head(20)
+        # Peer group size and page of institution columns
+        col1, col2 = st.columns(2)
+        with col1:
+            peer_count = st.number_input(
+                "比較対象の医療機関数（類似度上位）:",
+                min_value=1,
+                max_value=max(len(filtered_df), 1),
+                value=min(CROSS_TAB_PAGE_SIZE, max(len(filtered_df), 1)),
+                step=CROSS_TAB_PAGE_SIZE,
+                key='cross_tab_peer_count',
+                help="届出医療機関数・届出率はこの医療機関群全体で集計します"
+            )
+        page_count = max((int(peer_count) - 1) // CROSS_TAB_PAGE_SIZE + 1, 1)
+        with col2:
+            cross_tab_page = st.number_input(
+                f"表示ページ（全{page_count}ページ、1ページ{CROSS_TAB_PAGE_SIZE}件）:",
+                min_value=1,
+                max_value=page_count,
+                value=1,
+                key='cross_tab_page'
+            )
         
         # Create cross-tabulation DataFrame (no caching - always recalculate to reflect filter changes)
         with st.spinner("申請施設基準の届出状況を計算中..."):
             cross_tab_df = ShisetsuKijunFilingCrossTabDataFrame.from_jaccard_similarity(
-                top_20_filtered_df, df, selected_institution, top_n=20, 
-                target_institution_number=target_institution_number
+                filtered_df, df, selected_institution, top_n=CROSS_TAB_PAGE_SIZE,
+                target_institution_key=target_institution_key,
+                incidence=incidence,
+                peer_count=int(peer_count),
+                page=int(cross_tab_page) - 1
             )
         
         if len(cross_tab_df) > 0:
@@ -164,6 +248,8 @@ if selected_institution:
             
             # Get display DataFrame with proper column order
             display_df = filtered_cross_tab_df.get_display_dataframe(selected_institution)
+            if '届出率' in display_df.columns:
+                display_df['届出率'] = display_df['届出率'].apply(lambda x: f"{x:.1%}")
             
             # Display the table
             st.dataframe(
@@ -195,6 +281,15 @@ if selected_institution:
         - **Jaccard係数**: 2 ÷ 4 = 0.5 (50%)
         
         Jaccard係数は0から1の値を取り、1に近いほど類似度が高く、0に近いほど類似度が低いことを示します。
+        
+        **その他の指標：**
+        
+        - **IDF重み付きJaccard係数**: 各施設基準に $\\log(N / n)$（$N$: 届出のある医療機関数、$n$: その施設基準を届け出ている医療機関数）の重みを付けたJaccard係数。珍しい施設基準の一致ほど類似度が高くなります
+        - **コサイン類似度**: $\\frac{|A \\cap B|}{\\sqrt{|A| \\cdot |B|}}$
+        - **Overlap係数**: $\\frac{|A \\cap B|}{\\min(|A|, |B|)}$（一方の届出がもう一方にすべて含まれる場合に1）
+        - **Dice係数**: $\\frac{2 |A \\cap B|}{|A| + |B|}$
+        
+        いずれの指標も0から1の値を取ります。
         """)
 else:
     st.info("医療機関検索ページから医療機関を検索して選択してください。")
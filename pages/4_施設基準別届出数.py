@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
-from utils import load_raw_data
+from utils import select_dataset_month, load_raw_data
 from dataframes import ShisetsuKijunFilingStatusDataFrame
 
 st.title("📋 施設基準別届出数")
 
+# Dataset month (shared across pages)
+dataset_month = select_dataset_month()
+
 # Load raw data
 df = load_raw_data()
 
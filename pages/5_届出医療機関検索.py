@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
-from utils import load_raw_data, format_bed_count
+from utils import select_dataset_month, load_raw_data, load_filing_row_index, load_filing_options, load_filing_completion, format_bed_count
 from dataframes import ShisetsuKijunDataFrame
 
 st.title("🔍 届出医療機関検索")
 
+# Dataset month (shared across pages)
+dataset_month = select_dataset_month()
+
 # Create display columns (matching 医科医療機関検索)
 DISPLAY_COLUMNS = ['医療機関名称', '医療機関番号', '都道府県名', '病床数', '届出数', 
                    '算定開始年月日', '医療機関所在地（郵便番号）', '医療機関所在地（住所）', 
@@ -21,18 +24,36 @@ with col2:
 
 # Load data
 df = load_raw_data()
+filing_index = load_filing_row_index()
+
+# Get all available filing names and symbols for autocomplete (built once per dataset load)
+filing_display_options = load_filing_options()
 
-# Get all available filing names and symbols for autocomplete
-filing_display_options = df.get_filing_options()
+# Maximum number of completion candidates shown for a keyword
+MAX_COMPLETION_OPTIONS = 50
 
 # Search interface
 st.write("### 検索条件")
 
 # Single select for filing criteria
 if filing_display_options:
+    # Narrow the options by keyword (prefix match first, then near matches allowing typos)
+    filing_keyword = st.text_input(
+        "キーワードで候補を絞り込み:",
+        key='filing_search_keyword',
+        placeholder="例: 感染対策、ＣＴ",
+        help="受理届出名称・受理記号の前方一致を優先し、表記ゆれや誤字を含む候補も表示します"
+    )
+    if filing_keyword:
+        candidate_options = load_filing_completion().complete(filing_keyword, limit=MAX_COMPLETION_OPTIONS)
+        if not candidate_options:
+            st.warning("キーワードに一致する届出が見つかりませんでした。")
+    else:
+        candidate_options = filing_display_options
+    
     selected_display_option = st.selectbox(
         "受理届出名称または受理記号を選択:",
-        options=[""] + [opt['display'] for opt in filing_display_options],
+        options=[""] + [opt['display'] for opt in candidate_options],
         key='filing_search_select',
         help="受理届出名称または受理記号を選択してください"
     )
@@ -42,18 +63,16 @@ if filing_display_options:
     selected_filing_symbol = None
     
     if selected_display_option:
-        for opt in filing_display_options:
-            if opt['display'] == selected_display_option:
-                selected_filing_name = opt['name']
-                selected_filing_symbol = opt['symbol'] if opt['symbol'] else None
-                break
+        selected_option = {opt['display']: opt for opt in candidate_options}[selected_display_option]
+        selected_filing_name = selected_option['name']
+        selected_filing_symbol = selected_option['symbol'] if selected_option['symbol'] else None
     
     # Search
     if selected_filing_name:
         st.write("### 検索結果")
         
         with st.spinner("検索中..."):
-            institution_summary = df.search_institutions_by_filing(selected_filing_name, selected_filing_symbol)
+            institution_summary = df.search_institutions_by_filing(selected_filing_name, selected_filing_symbol, filing_index)
         
         if len(institution_summary) > 0:
             st.write(f"**該当医療機関数: {len(institution_summary):,} 件**")
@@ -0,0 +1,147 @@
+"""Equivalence of the vectorized bed count filters with the previous row-wise implementation"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from create_feather import expand_bed_counts
+from dataframes import JaccardSimilarityDataFrame, ShisetsuKijunDataFrame
+
+# Institutions (one or more rows each) covering the cases the row-wise filter distinguishes
+BED_COUNTS = [
+    {'一般': 20},
+    {'一般': 120, '療養': 40},
+    {'療養': 60},
+    {'精神': 200, '一般': 5},
+    {},
+    None,
+    {None: 22},
+    {'一般': 0},
+    {'一般': 50, '療養': 50, '精神': 50},
+    {'結核': 10},
+]
+
+BED_COUNT_FILTERS = [
+    {'一般': (1, 100)},
+    {'一般': (10, 60), '療養': (1, 45)},
+    {'療養': (50, 70)},
+    {'精神': (1, 10)},
+    {'一般': (0, 0)},
+    {'感染': (1, 5)},
+    {'一般': (1, 200), '療養': (1, 200), '精神': (1, 200)},
+]
+
+
+def reference_filter_by_bed_counts(df, bed_count_filters, unique_by):
+    """Row-wise filter as implemented before the vectorized rewrite (judges the first row per unique_by)"""
+    if unique_by in df.columns:
+        unique_institutions = df[[unique_by, '病床数']].drop_duplicates(subset=unique_by, keep='first')
+    else:
+        unique_institutions = df[['病床数']].copy()
+        unique_institutions['_index'] = unique_institutions.index
+        unique_by = '_index'
+    
+    def passes_bed_count_filter(row):
+        bed_count_dict = row['病床数']
+        if not isinstance(bed_count_dict, dict):
+            return True
+        for bed_type, (min_val, max_val) in bed_count_filters.items():
+            if bed_type in bed_count_dict:
+                bed_num = bed_count_dict[bed_type]
+                if isinstance(bed_num, (int, float)) and bed_num is not None:
+                    if not (min_val <= bed_num <= max_val):
+                        return False
+                else:
+                    return False
+        return True
+    
+    mask = unique_institutions.apply(passes_bed_count_filter, axis=1)
+    filtered_unique_values = unique_institutions[mask][unique_by].unique()
+    if unique_by == '_index':
+        return df[df.index.isin(filtered_unique_values)]
+    return df[df[unique_by].isin(filtered_unique_values)]
+
+
+def build_rows(bed_counts):
+    """Two filing rows per institution; the second row's 病床数 differs so only the first one may decide"""
+    rows = []
+    for i, bed_count in enumerate(bed_counts):
+        for j, second_bed_count in enumerate([bed_count, {'一般': 999}]):
+            rows.append({
+                '都道府県コード': 1.0 + i % 2,
+                '医療機関番号': 100000.0 + i,
+                '医療機関名称': f"医療機関{i}",
+                '受理届出名称': f"届出{j}",
+                '病床数': second_bed_count,
+            })
+    return rows
+
+
+@pytest.fixture(params=['dicts', 'typed'])
+def shisetsu_kijun_df(request, tmp_path):
+    """ShisetsuKijunDataFrame with 病床数 dicts only, or loaded from the typed feather layout"""
+    df = pd.DataFrame(build_rows(BED_COUNTS))
+    if request.param == 'dicts':
+        return ShisetsuKijunDataFrame(df)
+    
+    bed_dicts = [bed_count if isinstance(bed_count, dict) else {} for bed_count in df['病床数']]
+    output_df = pd.concat([df.drop(columns='病床数'), expand_bed_counts(bed_dicts)], axis=1)
+    output_df.to_feather(tmp_path / 'all.feather')
+    return ShisetsuKijunDataFrame.from_feather(tmp_path / 'all.feather')
+
+
+@pytest.mark.parametrize('bed_count_filters', BED_COUNT_FILTERS)
+def test_filter_by_bed_counts_matches_row_wise_filter(shisetsu_kijun_df, bed_count_filters):
+    expected = reference_filter_by_bed_counts(shisetsu_kijun_df, bed_count_filters, '医療機関番号')
+    result = shisetsu_kijun_df.filter_by_bed_counts(bed_count_filters)
+    assert result.index.tolist() == expected.index.tolist()
+
+
+@pytest.mark.parametrize('bed_count_filters', BED_COUNT_FILTERS)
+def test_filter_by_bed_counts_without_unique_column_matches_row_wise_filter(shisetsu_kijun_df, bed_count_filters):
+    df = shisetsu_kijun_df.drop(columns='医療機関番号')
+    expected = reference_filter_by_bed_counts(df, bed_count_filters, '医療機関番号')
+    result = df.filter_by_bed_counts_generic(bed_count_filters)
+    assert result.index.tolist() == expected.index.tolist()
+
+
+def test_filter_by_bed_counts_treats_non_numeric_counts_as_failing():
+    df = ShisetsuKijunDataFrame(pd.DataFrame(build_rows([{'一般': '不明'}, {'一般': 30}])))
+    bed_count_filters = {'一般': (1, 100)}
+    expected = reference_filter_by_bed_counts(df, bed_count_filters, '医療機関番号')
+    result = df.filter_by_bed_counts(bed_count_filters)
+    assert result.index.tolist() == expected.index.tolist()
+    assert result['医療機関番号'].unique().tolist() == [100001.0]
+
+
+@pytest.mark.parametrize('bed_count_filters', BED_COUNT_FILTERS)
+def test_similarity_filter_by_bed_counts_matches_row_wise_filter(bed_count_filters):
+    df = ShisetsuKijunDataFrame(pd.DataFrame(build_rows(BED_COUNTS)))
+    target_name = df['医療機関名称'].iloc[0]
+    similar_df = JaccardSimilarityDataFrame.from_shisetsu_kijun(df, target_name)
+    assert len(similar_df) > 0
+    
+    expected = reference_filter_by_bed_counts(similar_df, bed_count_filters, '医療機関名称')
+    result = similar_df.filter_by_bed_counts_generic(bed_count_filters)
+    assert result.index.tolist() == expected.index.tolist()
+    np.testing.assert_array_equal(result['類似度'].to_numpy(), expected['類似度'].to_numpy())
+
+
+def test_boolean_mask_assignment_rebuilds_bed_index(shisetsu_kijun_df):
+    bed_count_filters = {'一般': (1, 100)}
+    shisetsu_kijun_df.filter_by_bed_counts(bed_count_filters)
+    
+    reversed_df = shisetsu_kijun_df.iloc[::-1].set_axis(shisetsu_kijun_df.index)
+    shisetsu_kijun_df[shisetsu_kijun_df['医療機関番号'] < 100004] = reversed_df
+    expected = reference_filter_by_bed_counts(shisetsu_kijun_df, bed_count_filters, '医療機関番号')
+    result = shisetsu_kijun_df.filter_by_bed_counts(bed_count_filters)
+    assert result.index.tolist() == expected.index.tolist()
+
+
+def test_filter_by_bed_types_with_more_bed_types_than_one_word():
+    # Bed type names are word combinations, so a month can have more than 64 of them
+    bed_counts = [{f"一般 療養{i}": i + 1} for i in range(100)]
+    df = ShisetsuKijunDataFrame(pd.DataFrame(build_rows(bed_counts)))
+    assert len(df.get_all_bed_types()) == 101
+    
+    result = df.filter_by_bed_types(['一般 療養3', '一般 療養97'])
+    assert result['医療機関番号'].unique().tolist() == [100003.0, 100097.0]
@@ -0,0 +1,48 @@
+"""Institution attributes of the normalized dataset and the institution summary"""
+import pandas as pd
+
+from create_feather import build_institution_summary, build_normalized_tables
+from dataframes.shisetsu_kijun import INSTITUTION_KEY_COLUMNS
+
+
+def build_filings():
+    """Filings whose first row per institution lacks some attributes another row has"""
+    return pd.DataFrame({
+        '都道府県コード': [1.0, 1.0, 1.0, 2.0, 2.0, 11.0],
+        '医療機関番号': [100.0, 100.0, 200.0, 100.0, 100.0, 300.0],
+        '医療機関名称': ['北病院', '北病院', '東医院', '南病院', '南病院', '西医院'],
+        '種別': [None, '病院', '診療所', '病院', None, None],
+        'FAX番号': [None, None, '01-2345', None, '02-3456', None],
+        '病床数_一般': pd.array([pd.NA, 40, pd.NA, 120, pd.NA, pd.NA], dtype='Int32'),
+        '受理番号': ['(A)1', '(B)2', '(A)3', '(A)4', '(C)5', '(A)6'],
+        '受理届出名称': ['届出A', '届出B', '届出A', '届出A', '届出C', None],
+        '受理記号': ['A', 'B', 'A', 'A', 'C', None],
+    })
+
+
+def test_institutions_take_first_non_null_attribute():
+    df = build_filings()
+    institutions, _, _ = build_normalized_tables(df)
+    
+    expected = df.drop(columns=['受理番号', '受理届出名称', '受理記号']).groupby(INSTITUTION_KEY_COLUMNS).first().reset_index()
+    pd.testing.assert_frame_equal(institutions.drop(columns='医療機関ID'), expected)
+    assert institutions['医療機関ID'].tolist() == list(range(len(institutions)))
+
+
+def test_institution_summary_matches_groupby_first():
+    df = build_filings()
+    summary = build_institution_summary(*build_normalized_tables(df))
+    
+    expected = (
+        df.groupby(INSTITUTION_KEY_COLUMNS)
+        .agg(**{
+            **{col: (col, 'first') for col in ['医療機関名称', '種別', 'FAX番号', '病床数_一般']},
+            '届出数': ('受理届出名称', 'count'),
+        })
+        .reset_index()
+        .astype({'届出数': 'int32'})
+        .sort_values('医療機関名称', kind='stable')
+        .reset_index(drop=True)
+    )
+    pd.testing.assert_frame_equal(summary, expected)
+    assert summary.set_index('医療機関名称').loc['北病院', ['種別', '病床数_一般']].tolist() == ['病院', 40]
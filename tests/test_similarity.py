@@ -0,0 +1,76 @@
+"""Bounded top-k similarity search against the full similarity ranking"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from create_neighbours import compute_neighbours
+from dataframes import FilingIncidenceMatrix, JaccardSimilarityDataFrame, ShisetsuKijunDataFrame
+from dataframes.jaccard_similarity import SIMILARITY_METRICS
+
+TARGET_NAME = '医療機関0'
+
+
+@pytest.fixture(scope='module')
+def shisetsu_kijun_df():
+    """Institutions with random filing sets; 医療機関番号 repeats across the two prefectures"""
+    rng = np.random.default_rng(0)
+    filing_names = [f"届出{i:02d}" for i in range(40)]
+    rows = []
+    for i in range(300):
+        # Common filings are held by many institutions, so scores tie and sizes vary
+        n_filings = rng.integers(1, 25)
+        filings = rng.choice(len(filing_names), size=n_filings, replace=False, p=np.linspace(2, 1, len(filing_names)) / 60)
+        for f in filings:
+            rows.append({
+                '都道府県コード': float(1 + i % 2),
+                '医療機関番号': float(1000 + i // 2),
+                '医療機関名称': f"医療機関{i}",
+                '受理届出名称': filing_names[f],
+                '受理記号': f"記{f}",
+                '病床数': {'一般': int(i % 7) * 10} if i % 3 else {},
+            })
+    return ShisetsuKijunDataFrame(pd.DataFrame(rows))
+
+
+@pytest.fixture(scope='module')
+def incidence(shisetsu_kijun_df):
+    return FilingIncidenceMatrix.from_shisetsu_kijun(shisetsu_kijun_df)
+
+
+def assert_top_k_matches(result, expected, k):
+    """The top-k scores equal the k best of the full ranking, and every row keeps its full score"""
+    assert len(expected) > 0
+    assert len(result) == min(k, len(expected))
+    np.testing.assert_allclose(result['類似度'].to_numpy(), expected['類似度'].head(k).to_numpy())
+    
+    full_scores = expected.set_index(['都道府県コード', '医療機関番号'])['類似度']
+    keys = pd.MultiIndex.from_frame(result[['都道府県コード', '医療機関番号']])
+    np.testing.assert_allclose(result['類似度'].to_numpy(), full_scores.reindex(keys).to_numpy())
+
+
+@pytest.mark.parametrize('metric', SIMILARITY_METRICS)
+@pytest.mark.parametrize('k', [1, 10, 50, 1000])
+def test_top_k_similar_matches_full_ranking(shisetsu_kijun_df, incidence, metric, k):
+    expected = JaccardSimilarityDataFrame.from_shisetsu_kijun(shisetsu_kijun_df, TARGET_NAME, incidence=incidence, metric=metric)
+    result = JaccardSimilarityDataFrame.top_k_similar(shisetsu_kijun_df, TARGET_NAME, k=k, incidence=incidence, metric=metric)
+    assert_top_k_matches(result, expected, k)
+
+
+@pytest.mark.parametrize('metric', SIMILARITY_METRICS)
+def test_top_k_similar_restricted_to_candidates(shisetsu_kijun_df, incidence, metric):
+    candidates = shisetsu_kijun_df[shisetsu_kijun_df['都道府県コード'] == 2.0]
+    expected = JaccardSimilarityDataFrame.from_shisetsu_kijun(shisetsu_kijun_df, TARGET_NAME, incidence=incidence, metric=metric)
+    expected = expected[expected['都道府県コード'] == 2.0]
+    result = JaccardSimilarityDataFrame.top_k_similar(
+        shisetsu_kijun_df, TARGET_NAME, k=20, incidence=incidence, candidate_institutions=candidates, metric=metric
+    )
+    assert_top_k_matches(result, expected, 20)
+
+
+def test_from_neighbours_matches_top_k_similar(shisetsu_kijun_df, incidence):
+    neighbours = compute_neighbours(incidence, top_n=15, max_workers=1, chunk_size=64)
+    for target_name in ['医療機関0', '医療機関1', '医療機関77']:
+        result = JaccardSimilarityDataFrame.from_neighbours(shisetsu_kijun_df, target_name, neighbours, incidence=incidence)
+        expected = JaccardSimilarityDataFrame.top_k_similar(shisetsu_kijun_df, target_name, k=15, incidence=incidence)
+        assert len(result) == 15
+        np.testing.assert_allclose(result['類似度'].to_numpy(), expected['類似度'].to_numpy(), rtol=1e-6)
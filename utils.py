@@ -1,15 +1,157 @@
 import streamlit as st
+import pandas as pd
 import ast
-from pathlib import Path
-from dataframes import ShisetsuKijunDataFrame
+from dataframes import ShisetsuKijunDataFrame, FilingIncidenceMatrix, FilingRowIndex, InstitutionNameIndex, CompletionIndex, DatasetRegistry
+from dataframes.shisetsu_kijun import get_companion_file_path
+from dataframes.dataset_registry import get_dataset_fingerprint, load_dataset
 
-feather_file_path = "data/2025/10/all.feather"
+# Monthly datasets are discovered under data/YYYY/MM
+DATA_DIR = "data"
+
+# Months kept in memory by the shared registry (least recently used months are evicted)
+MAX_RESIDENT_DATASETS = 2
 
 
 @st.cache_resource
-def load_raw_data():
-    """Load raw data from feather file"""
-    return ShisetsuKijunDataFrame.from_feather(feather_file_path)
+def get_dataset_registry():
+    """Get dataset registry shared by all sessions"""
+    return DatasetRegistry(DATA_DIR, max_datasets=MAX_RESIDENT_DATASETS)
+
+
+def format_dataset_month(month):
+    """Format month key for display (e.g. "2025/10" -> "2025年10月")"""
+    year, month_number = month.split('/')
+    return f"{year}年{int(month_number)}月"
+
+
+def get_selected_month():
+    """Get month selected in this session (latest available month by default)"""
+    months = get_dataset_registry().get_months()
+    month = st.session_state.get('dataset_month')
+    if month not in months:
+        month = months[0] if months else None
+    return month
+
+
+def select_dataset_month():
+    """Show month selector in the sidebar and return the selected month
+    
+    Stops the page if no dataset is found under DATA_DIR.
+    """
+    months = get_dataset_registry().get_months()
+    if not months:
+        st.error(f"データが見つかりません（{DATA_DIR}/YYYY/MM/*.feather）。create_feather.pyでデータを作成してください。")
+        st.stop()
+    
+    month = st.sidebar.selectbox(
+        "データ年月:",
+        options=months,
+        index=months.index(get_selected_month()),
+        format_func=format_dataset_month,
+        help="表示する名簿の年月を選択します"
+    )
+    # Kept outside the widget so the selection survives switching pages
+    st.session_state['dataset_month'] = month
+    return month
+
+
+def get_dataset_resource(name, factory, month=None):
+    """Get a resource of a dataset month from the shared registry, creating it on first use
+    
+    Args:
+        name: Resource name
+        factory: Function called with the dataset file path to create the resource
+        month: Month key (default: month selected in this session)
+    """
+    return get_dataset_registry().get_resource(month or get_selected_month(), name, factory)
+
+
+def load_raw_data(month=None):
+    """Load raw data from the normalized dataset if available, otherwise from the flat feather file"""
+    return get_dataset_resource('raw_data', load_dataset, month)
+
+
+def load_institution_summary(month=None):
+    """Load one row per institution with its filing count (aggregated from the raw data if the summary file is missing)"""
+    month = month or get_selected_month()
+    
+    def create(file_path):
+        if get_companion_file_path(file_path, 'institution_summary').exists():
+            return ShisetsuKijunDataFrame.from_institution_summary(file_path)
+        return load_raw_data(month).aggregate_by_institution_name().sort_values('医療機関名称')
+    return get_dataset_resource('institution_summary', create, month)
+
+
+def load_institution_name_index(month=None):
+    """Load n-gram search index over the names of the institution summary"""
+    month = month or get_selected_month()
+    return get_dataset_resource(
+        'institution_name_index',
+        lambda file_path: InstitutionNameIndex.from_shisetsu_kijun(load_institution_summary(month)),
+        month,
+    )
+
+
+def load_institution_name_completion(month=None):
+    """Load completion index over institution names (shared by all sessions)"""
+    month = month or get_selected_month()
+    return get_dataset_resource(
+        'institution_name_completion',
+        lambda file_path: CompletionIndex.from_institution_names(load_institution_summary(month)['医療機関名称']),
+        month,
+    )
+
+
+def load_filing_options(month=None):
+    """Load filing name/symbol options of the raw data"""
+    month = month or get_selected_month()
+    return get_dataset_resource('filing_options', lambda file_path: load_raw_data(month).get_filing_options(), month)
+
+
+def load_filing_completion(month=None):
+    """Load completion index over filing names and symbols (shared by all sessions)"""
+    month = month or get_selected_month()
+    return get_dataset_resource(
+        'filing_completion',
+        lambda file_path: CompletionIndex.from_filing_options(load_filing_options(month)),
+        month,
+    )
+
+
+def load_filing_incidence(month=None):
+    """Load institution × filing type incidence matrix shared by all analyses"""
+    month = month or get_selected_month()
+    return get_dataset_resource(
+        'filing_incidence',
+        lambda file_path: FilingIncidenceMatrix.from_shisetsu_kijun(load_raw_data(month)),
+        month,
+    )
+
+
+def load_neighbours(month=None):
+    """Load precomputed nearest-neighbour table
+    
+    Returns None (exact search) if create_neighbours.py hasn't been run, or if the table was
+    computed from an older version of the dataset.
+    """
+    def create(file_path):
+        neighbours_file_path = get_companion_file_path(file_path, 'neighbours')
+        if not neighbours_file_path.exists():
+            return None
+        neighbours = pd.read_feather(neighbours_file_path)
+        # Tables written before neighbours were keyed by 都道府県コード can't be looked up
+        if not {'都道府県コード', '類似都道府県コード'}.issubset(neighbours.columns):
+            return None
+        if neighbours.attrs.get('source_fingerprint') != get_dataset_fingerprint(file_path):
+            return None
+        return neighbours
+    return get_dataset_resource('neighbours', create, month)
+
+
+def load_filing_row_index(month=None):
+    """Load inverted index from filing name/symbol to rows of the raw data"""
+    month = month or get_selected_month()
+    return get_dataset_resource('filing_row_index', lambda file_path: FilingRowIndex.from_shisetsu_kijun(load_raw_data(month)), month)
 
 
 def format_bed_count(bed_count):